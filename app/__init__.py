@@ -27,6 +27,22 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login.init_app(app)
 
+    # rate limiting for the public check-in endpoints
+    from app import throttle
+    throttle.init_app(app)
+
+    # versioned cache for the admin dashboard data
+    from app import cache
+    cache.init_app(app)
+
+    # background export jobs and their cached files
+    from app import jobs
+    jobs.init_app(app)
+
+    # rendered QR code images
+    from app import qrimage
+    qrimage.init_app(app)
+
     # timezone-aware formatting filter
     def format_datetime(value, fmt='%d/%m/%Y %H:%M'):
         if value is None:
@@ -54,41 +70,59 @@ def create_app(config_class=Config):
 
     # ensure initial administrator and regions exist
     with app.app_context():
-        from app.models import User, Admin, Region
-        # default credentials (can override via env for testing)
-        default_phone = os.environ.get('DEFAULT_ADMIN_PHONE', '14 981364342')
-        default_pass = os.environ.get('DEFAULT_ADMIN_PASSWORD', 'jr34139251')
-        default_name = os.environ.get('DEFAULT_ADMIN_NAME', 'ARNALDO MARTINS HIDALGO JUNIOR')
-        # normalise into digits
-        default_phone = ''.join(ch for ch in default_phone if ch.isdigit())
-
-        # ensure there is at least one administrator with the default phone
-        adm_user = User.query.filter_by(telefone=default_phone).first()
-        if adm_user is None:
-            # create new user+admin even if other admins exist
-            u = User(telefone=default_phone, nome=default_name, cor='', region=None)
-            db.session.add(u)
-            db.session.commit()
-            admin = Admin(user=u, is_original=True)
-            admin.set_password(default_pass)
-            db.session.add(admin)
-            db.session.commit()
-        else:
-            # ensure the found user has an admin record
-            if not adm_user.admin_record:
-                admin = Admin(user=adm_user, is_original=True)
+        from sqlalchemy.exc import OperationalError, ProgrammingError
+        try:
+            from app.models import User, Admin, Region
+            # default credentials (can override via env for testing)
+            default_phone = os.environ.get('DEFAULT_ADMIN_PHONE', '14 981364342')
+            default_pass = os.environ.get('DEFAULT_ADMIN_PASSWORD', 'jr34139251')
+            default_name = os.environ.get('DEFAULT_ADMIN_NAME', 'ARNALDO MARTINS HIDALGO JUNIOR')
+            # normalise into digits
+            default_phone = ''.join(ch for ch in default_phone if ch.isdigit())
+
+            # ensure there is at least one administrator with the default phone
+            adm_user = User.by_phone(default_phone)
+            if adm_user is None:
+                # create new user+admin even if other admins exist
+                u = User(telefone=default_phone, nome=default_name, cor='', region=None)
+                db.session.add(u)
+                db.session.commit()
+                admin = Admin(user=u, is_original=True)
                 admin.set_password(default_pass)
                 db.session.add(admin)
                 db.session.commit()
-            # if there is an admin but the password may be wrong, do not overwrite blindly
-            # but we could reset the hash if the account is marked original and the
-            # password in DB doesn't verify.  Skip for now.
-
-        # seed regions list
-        defaults = ['branca','black','verde','roxa','amarela','laranja','azul celeste','azul marinho','vinho novo']
-        for regname in defaults:
-            if not Region.query.filter_by(nome=regname).first():
-                db.session.add(Region(nome=regname))
-        db.session.commit()
+            else:
+                # ensure the found user has an admin record
+                if not adm_user.admin_record:
+                    admin = Admin(user=adm_user, is_original=True)
+                    admin.set_password(default_pass)
+                    db.session.add(admin)
+                    db.session.commit()
+                # if there is an admin but the password may be wrong, do not overwrite blindly
+                # but we could reset the hash if the account is marked original and the
+                # password in DB doesn't verify.  Skip for now.
+
+            # seed regions list
+            defaults = ['branca','black','verde','roxa','amarela','laranja','azul celeste','azul marinho','vinho novo']
+            for regname in defaults:
+                if not Region.query.filter_by(nome=regname).first():
+                    db.session.add(Region(nome=regname))
+            db.session.commit()
+        except (OperationalError, ProgrammingError):
+            # schema not migrated yet (e.g. while running `flask db upgrade`)
+            db.session.rollback()
+            app.logger.warning('database schema out of date; skipping default admin/regions setup')
+
+    # flask CLI commands (loadtest, ...)
+    from app import commands
+    commands.init_app(app)
+
+    # optional write-behind journal for check-ins (replays pending rows)
+    from app import journal
+    journal.init_app(app)
+
+    # optional async check-in views on an async database driver
+    from app import aio
+    aio.init_app(app)
 
     return app
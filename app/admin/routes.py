@@ -2,13 +2,13 @@ from flask import render_template, redirect, url_for, flash, request, current_ap
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from app.admin import bp
-from app import db
+from app import db, checkin, live, stats, cache, analytics, arrivals, exports, jobs, qrimage, snapshot
+from app.stats import meeting_stats, open_qrcodes
 from app.models import User, Admin, Event, Meeting, QRCode, Attendance, Region, Team, AccessRequest
-from flask import send_file, make_response, abort
-import io
-import qrcode
+from flask import send_file, make_response, abort, jsonify
+import os
 import secrets
-from datetime import datetime
+from datetime import datetime, date
 
 
 @bp.route('/login', methods=['GET', 'POST'])
@@ -21,18 +21,7 @@ def login():
         current_app.logger.debug(f"admin login attempt with telefone={telefone}")
         password = request.form.get('password')
         try:
-            user = User.query.filter_by(telefone=telefone).first()
-            # if the phone isn't found, try to locate by normalizing stored values
-            if user is None:
-                for u in User.query.all():
-                    norm = ''.join(ch for ch in u.telefone if ch.isdigit())
-                    if norm == telefone:
-                        user = u
-                        # persist normalized value for future logins
-                        u.telefone = telefone
-                        db.session.commit()
-                        current_app.logger.debug(f"normalized stored telefone for user {u.id}")
-                        break
+            user = User.by_phone(telefone)
         except Exception as e:
             # could be operational error (DB not reachable)
             flash('Erro de conexão ao banco de dados, verifique se o serviço está ativo.', 'danger')
@@ -65,152 +54,169 @@ def dashboard():
     # filtering parameters
     participant_q = request.args.get('participant', '').strip().lower()
     region_id = request.args.get('region_id')
-    regions = Region.query.order_by(Region.nome).all()
-    # open QR codes (active and event not finished)
     today = datetime.utcnow().date()
-    open_qrs = [q for q in QRCode.query.filter_by(active=True).all() if q.meeting.event.data_final >= today]
-    # meeting statistics
-    stats = []
-    chart_labels = []
-    chart_totals = []
-    # region totals for pie chart
-    region_counts = {}
-    # iterate by event -> meetings sorted by date
-    events = Event.query.order_by(Event.data_inicial).all()
-    # region-by-meeting counts will support another chart
-    region_meeting = {}  # region -> list of totals per meeting (aligned with chart_labels)
-    for ev in events:
-        meetings = sorted(ev.meetings, key=lambda m: m.data)
-        for idx, mt in enumerate(meetings):
-            # apply filters: participant and region
-            if participant_q:
-                matched = any(participant_q in a.user.nome.lower() or participant_q in a.user.telefone for a in mt.attendances)
-                if not matched:
-                    continue
-            if region_id:
-                matched = any(str(a.user.region_id) == str(region_id) for a in mt.attendances)
-                if not matched:
-                    continue
-            total = len(mt.attendances)
-            # accumulate bar chart
-            chart_labels.append(f"{ev.nome} - {mt.titulo or mt.data.strftime('%d/%m/%Y')}")
-            chart_totals.append(total)
-            by_region = {}
-            for att in mt.attendances:
-                cor = att.user.cor
-                by_region[cor] = by_region.get(cor, 0) + 1
-                region_counts[cor] = region_counts.get(cor, 0) + 1
-            # record per-region data for this meeting
-            for cor, cnt in by_region.items():
-                region_meeting.setdefault(cor, []).append(cnt)
-            # ensure zeros for regions with no attendees this meeting
-            for cor in list(region_counts.keys()):
-                if cor not in by_region:
-                    region_meeting.setdefault(cor, []).append(0)
-            new = missing = 0
-            prev = meetings[idx - 1] if idx > 0 else None
-            if prev:
-                prev_users = {a.user_id for a in prev.attendances}
-                curr_users = {a.user_id for a in mt.attendances}
-                new = len(curr_users - prev_users)
-                missing = len(prev_users - curr_users)
-            stats.append({'event': ev, 'meeting': mt, 'total': total,
-                          'by_region': by_region, 'new': new, 'missing': missing})
-    return render_template('dashboard.html', open_qrs=open_qrs, stats=stats,
-                           chart_labels=chart_labels, chart_totals=chart_totals,
-                           region_labels=list(region_counts.keys()),
-                           region_totals=list(region_counts.values()),
-                           region_meeting=region_meeting,
-                           participant_q=participant_q, regions=regions, region_id=region_id)
+    # the page itself is a light shell; charts and the detail table are
+    # fetched from the /charts/* endpoints below
+    data, hit = cache.get().get_or_compute(('dashboard', today),
+                                           lambda: _dashboard_data(today))
+    response = make_response(render_template('dashboard.html', participant_q=participant_q,
+                                             region_id=region_id,
+                                             chart_events=current_app.config['DASHBOARD_EVENTS'],
+                                             **data))
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+def _dashboard_data(today):
+    return {
+        'regions': stats.regions(),
+        # open QR codes (active and event not finished)
+        'open_qrs': open_qrcodes(today),
+    }
+
+
+def _chart_rows():
+    """Dashboard rows for the chart endpoints: same filters as the dashboard,
+    windowed by ?events=N&offset=K (most recent first) and ?start/end dates."""
+    participant_q = request.args.get('participant', '').strip().lower()
+    region_id = request.args.get('region_id') or None
+    rows, hit = cache.get().get_or_compute(('meeting_stats', participant_q, region_id),
+                                           lambda: meeting_stats(participant_q, region_id))
+    rows, has_more = stats.window(
+        rows,
+        events=request.args.get('events', current_app.config['DASHBOARD_EVENTS'], type=int),
+        offset=request.args.get('offset', 0, type=int),
+        start=request.args.get('start', type=date.fromisoformat),
+        end=request.args.get('end', type=date.fromisoformat))
+    return rows, has_more, hit
+
+
+def _chart_response(build):
+    rows, has_more, hit = _chart_rows()
+    response = jsonify(dict(build(rows), has_more=has_more))
+    response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+@bp.route('/charts/attendance')
+@login_required
+def chart_attendance():
+    return _chart_response(stats.attendance_chart)
+
+
+@bp.route('/charts/regions')
+@login_required
+def chart_regions():
+    return _chart_response(stats.region_chart)
+
+
+@bp.route('/charts/region-meetings')
+@login_required
+def chart_region_meetings():
+    return _chart_response(stats.region_meeting_chart)
+
+
+@bp.route('/analytics')
+@login_required
+def analytics_page():
+    # ?events=N limits the tables to the N most recent events (0 = all)
+    last_events = request.args.get('events', 10, type=int)
+    data = analytics.report(last_events)
+    return render_template('analytics.html', last_events=last_events,
+                           streak_lengths=range(2, analytics.STREAK_MAX + 1), **data)
+
+
+@bp.route('/analytics/data')
+@login_required
+def analytics_data():
+    last_events = request.args.get('events', 10, type=int)
+    return jsonify(analytics.as_json(analytics.report(last_events)))
+
+
+@bp.route('/events/<int:event_id>/arrivals')
+@login_required
+def event_arrivals(event_id):
+    ev = Event.query.get_or_404(event_id)
+    return render_template('arrivals.html', event=ev, report=arrivals.event_report(ev))
+
+
+@bp.route('/events/<int:event_id>/arrivals/data')
+@login_required
+def event_arrivals_data(event_id):
+    return jsonify(arrivals.event_report(Event.query.get_or_404(event_id)))
+
+
+@bp.route('/meetings/<int:meeting_id>/arrivals/data')
+@login_required
+def meeting_arrivals_data(meeting_id):
+    return jsonify(arrivals.meeting_report(Meeting.query.get_or_404(meeting_id)))
+
+
+@bp.route('/cache')
+@login_required
+def cache_info():
+    # hit/miss counters of the dashboard cache (per worker)
+    return jsonify(cache.get().info())
 
 
 @bp.route('/dashboard/export/<fmt>')
 @login_required
 
 def export_dashboard(fmt):
-    # replicate logic from dashboard for stats without filters
-    stats = []
-    region_counts = {}
-    events = Event.query.order_by(Event.data_inicial).all()
-    for ev in events:
-        meetings = sorted(ev.meetings, key=lambda m: m.data)
-        for idx, mt in enumerate(meetings):
-            total = len(mt.attendances)
-            by_region = {}
-            for att in mt.attendances:
-                cor = att.user.cor
-                by_region[cor] = by_region.get(cor, 0) + 1
-                region_counts[cor] = region_counts.get(cor, 0) + 1
-            new = missing = 0
-            prev = meetings[idx - 1] if idx > 0 else None
-            if prev:
-                prev_users = {a.user_id for a in prev.attendances}
-                curr_users = {a.user_id for a in mt.attendances}
-                new = len(curr_users - prev_users)
-                missing = len(prev_users - curr_users)
-            stats.append({'event': ev, 'meeting': mt, 'total': total,
-                          'by_region': by_region, 'new': new, 'missing': missing})
-    # prepare rows for export
-    rows = []
-    for s in stats:
-        row = {
-            'Evento': s['event'].nome,
-            'Reunião': s['meeting'].titulo or s['meeting'].data.strftime('%d/%m/%Y'),
-            'Total': s['total'],
-            'Novos': s['new'],
-            'Faltaram': s['missing'],
-        }
-        # flatten region breakdown
-        for cor, cnt in s['by_region'].items():
-            row[f'Região {cor}'] = cnt
-        rows.append(row)
-    if fmt == 'xlsx':
-        import pandas as pd, io
-        df = pd.DataFrame(rows)
-        bio = io.BytesIO()
-        df.to_excel(bio, index=False)
-        bio.seek(0)
-        return send_file(bio, download_name="dashboard_stats.xlsx",
-                         as_attachment=True,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    elif fmt == 'pdf':
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
-        import io
-        bio = io.BytesIO()
-        c = canvas.Canvas(bio, pagesize=letter)
-        text = c.beginText(40, 750)
-        text.textLine("Dashboard statistics")
-        text.textLine('')
-        for s in stats:
-            text.textLine(f"{s['event'].nome} - {s['meeting'].titulo or s['meeting'].data.strftime('%d/%m/%Y')}: {s['total']} presenças")
-        c.drawText(text)
-        c.showPage()
-        c.save()
-        bio.seek(0)
-        return send_file(bio, download_name="dashboard_stats.pdf",
-                         as_attachment=True,
-                         mimetype='application/pdf')
-    else:
+    # same stats as the dashboard, without filters
+    return _export('dashboard', None, fmt, 'dashboard_stats')
+
+
+def _export(kind, object_id, fmt, download_name):
+    """Queue an export; send it if it is ready within EXPORT_WAIT seconds,
+    otherwise show the progress page that downloads it when done."""
+    if fmt not in jobs.FORMATS[kind]:
         abort(404)
-    for ev in events:
-        meetings = sorted(ev.meetings, key=lambda m: m.data)
-        for idx, mt in enumerate(meetings):
-            total = len(mt.attendances)
-            by_region = {}
-            for att in mt.attendances:
-                cor = att.user.cor
-                by_region[cor] = by_region.get(cor, 0) + 1
-            new = missing = 0
-            prev = meetings[idx - 1] if idx > 0 else None
-            if prev:
-                prev_users = {a.user_id for a in prev.attendances}
-                curr_users = {a.user_id for a in mt.attendances}
-                new = len(curr_users - prev_users)
-                missing = len(prev_users - curr_users)
-            stats.append({'event': ev, 'meeting': mt, 'total': total,
-                          'by_region': by_region, 'new': new, 'missing': missing})
-    return render_template('dashboard.html', open_qrs=open_qrs, stats=stats)
+    queue = jobs.get()
+    job = queue.submit(kind, object_id, fmt, download_name)
+    if queue.wait(job, current_app.config['EXPORT_WAIT']):
+        return _send_export(job)
+    return redirect(url_for('admin.export_job', job_id=job.id))
+
+
+def _send_export(job):
+    return send_file(job.path, download_name=job.download_name,
+                     as_attachment=True, mimetype=job.mimetype)
+
+
+@bp.route('/exports/<job_id>')
+@login_required
+def export_job(job_id):
+    job = jobs.get().get(job_id) or abort(404)
+    return render_template('export_job.html', job=job)
+
+
+@bp.route('/exports/<job_id>/status')
+@login_required
+def export_job_status(job_id):
+    job = jobs.get().get(job_id) or abort(404)
+    return jsonify(dict(job.as_json(),
+                        download_url=url_for('admin.export_job_download', job_id=job.id)))
+
+
+@bp.route('/exports/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    queue = jobs.get()
+    job = queue.get(job_id) or abort(404)
+    if job.status != 'done':
+        return redirect(url_for('admin.export_job', job_id=job.id))
+    if not os.path.exists(job.path):
+        # evicted since; build it again at the current version
+        job = queue.submit(job.kind, job.key[1], job.format, job.download_name.rsplit('.', 1)[0])
+        return redirect(url_for('admin.export_job', job_id=job.id))
+    return _send_export(job)
+
+
+@bp.route('/exports')
+@login_required
+def export_info():
+    return jsonify(jobs.get().info())
 
 
 # ---------- utility actions ----------
@@ -268,6 +274,7 @@ def clear_data():
     from sqlalchemy import text
     # delete all except original admin user
     db.session.execute(text('DELETE FROM attendance'))
+    db.session.execute(text('DELETE FROM meeting_stats'))
     db.session.execute(text('DELETE FROM qr_code'))
     db.session.execute(text('DELETE FROM meeting'))
     db.session.execute(text('DELETE FROM event'))
@@ -277,6 +284,7 @@ def clear_data():
     db.session.execute(text("DELETE FROM admin WHERE is_original = 0"))
     db.session.execute(text("DELETE FROM user WHERE id NOT IN (SELECT user_id FROM admin WHERE is_original=1)"))
     db.session.commit()
+    checkin.invalidate()
     flash('Dados do sistema removidos', 'success')
     return redirect(url_for('admin.dashboard'))
 
@@ -303,6 +311,7 @@ def delete_event(event_id):
     # thanks to SQLAlchemy relationships defined with cascade='all, delete-orphan'.
     db.session.delete(ev)
     db.session.commit()
+    checkin.invalidate()
     flash('Evento excluído', 'success')
     return redirect(url_for('admin.list_events'))
 
@@ -346,6 +355,7 @@ def edit_event(event_id):
             flash('Data final não pode ser anterior à inicial', 'danger')
             return redirect(url_for('admin.edit_event', event_id=event_id))
         db.session.commit()
+        checkin.invalidate()
         flash('Evento atualizado', 'success')
         return redirect(url_for('admin.list_events'))
     return render_template('edit_event.html', event=ev)
@@ -493,7 +503,7 @@ def new_user():
         if not telefone or not nome:
             flash('Telefone e nome são obrigatórios', 'danger')
             return redirect(url_for('admin.new_user'))
-        if User.query.filter_by(telefone=telefone).first():
+        if User.by_phone(telefone):
             flash('Telefone já cadastrado', 'danger')
             return redirect(url_for('admin.new_user'))
         u = User(telefone=telefone, nome=nome, cor=cor or '-', region_id=region_id)
@@ -515,8 +525,12 @@ def edit_user(user_id):
     regions = Region.query.order_by(Region.nome).all()
     if request.method == 'POST':
         user.nome = request.form.get('nome')
+        old_cor = user.cor
         user.cor = request.form.get('cor')
         user.region_id = request.form.get('region_id') or None
+        if user.cor != old_cor:
+            # the dashboard counts attendances by colour
+            stats.recount(stats.attended(user.id))
         db.session.commit()
         flash('Usuário atualizado', 'success')
         return redirect(url_for('admin.list_users'))
@@ -532,11 +546,13 @@ def delete_user(user_id):
         return redirect(url_for('admin.list_users'))
     # perform raw SQL deletes to fully remove user and related records
     from sqlalchemy import text
+    meeting_ids = stats.attended(user.id)
     # order matters due to FK constraints
     db.session.execute(text('DELETE FROM attendance WHERE user_id = :uid'), {'uid': user.id})
     db.session.execute(text('DELETE FROM team_member WHERE user_id = :uid'), {'uid': user.id})
     db.session.execute(text('DELETE FROM admin WHERE user_id = :uid'), {'uid': user.id})
     db.session.execute(text('DELETE FROM user WHERE id = :uid'), {'uid': user.id})
+    stats.recount(meeting_ids)
     db.session.commit()
     flash('Usuário excluído', 'success')
     return redirect(url_for('admin.list_users'))
@@ -586,6 +602,7 @@ def edit_meeting(meeting_id):
         special = bool(request.form.get('special'))
         mt.special = special
         db.session.commit()
+        checkin.invalidate()
         flash('Reunião atualizada', 'success')
         return redirect(url_for('admin.event_detail', event_id=mt.event_id))
     return render_template('edit_meeting.html', meeting=mt)
@@ -595,7 +612,14 @@ def edit_meeting(meeting_id):
 @login_required
 def meeting_detail(meeting_id):
     mt = Meeting.query.get_or_404(meeting_id)
-    return render_template('meeting_detail.html', meeting=mt)
+    return render_template('meeting_detail.html', meeting=mt, attendances=_meeting_attendances(mt.id))
+
+
+def _meeting_attendances(meeting_id):
+    # attendances with their users in one query (the templates read att.user)
+    from sqlalchemy.orm import joinedload
+    return (Attendance.query.options(joinedload(Attendance.user).joinedload(User.admin_record))
+            .filter_by(meeting_id=meeting_id).order_by(Attendance.id).all())
 
 
 # compute next meeting date and type for event pattern
@@ -702,7 +726,41 @@ def manage_team_members(team_id):
 @login_required
 def attendance_list(meeting_id):
     mt = Meeting.query.get_or_404(meeting_id)
-    return render_template('attendance.html', meeting=mt)
+    return render_template('attendance.html', meeting=mt, attendances=_meeting_attendances(mt.id))
+
+
+@bp.route('/meetings/<int:meeting_id>/attendance/stream')
+@login_required
+def attendance_stream(meeting_id):
+    # Server-Sent Events: running total, attendances after ?after_id= (the
+    # last one the page shows; Last-Event-ID on reconnects), then
+    # attendances added/removed from now on
+    from sqlalchemy import func
+    Meeting.query.get_or_404(meeting_id)
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = request.args.get('after_id', type=int)
+    hidden = set()
+    if request.args.get('hide_original') == '1' and current_user.telefone != '14981364342':
+        # attendance.html leaves the original admin out for everyone else
+        hidden = {uid for (uid,) in db.session.query(Admin.user_id).filter_by(is_original=True)}
+    # subscribe before counting so nothing committed in between is missed
+    q = live.subscribe(meeting_id)
+    try:
+        total = db.session.query(func.count(Attendance.id)).filter_by(meeting_id=meeting_id).scalar()
+        backlog = [live.row(att.id, user, att.confirmado_em) for att, user in
+                   db.session.query(Attendance, User).join(User, Attendance.user_id == User.id)
+                   .filter(Attendance.meeting_id == meeting_id, Attendance.id > after_id)
+                   .order_by(Attendance.id)] if after_id is not None else []
+    except Exception:
+        live.unsubscribe(meeting_id, q)
+        raise
+    response = current_app.response_class(live.stream(meeting_id, q, total, backlog, hidden),
+                                          mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # keep reverse proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @bp.route('/attendance/<int:att_id>/delete', methods=['POST'])
 @login_required
@@ -710,7 +768,9 @@ def delete_attendance(att_id):
     att = Attendance.query.get_or_404(att_id)
     mt_id = att.meeting_id
     db.session.delete(att)
+    stats.recount([mt_id])
     db.session.commit()
+    live.attendance_removed(mt_id, att_id)
     flash('Presença removida', 'success')
     return redirect(url_for('admin.attendance_list', meeting_id=mt_id))
 
@@ -718,83 +778,13 @@ def delete_attendance(att_id):
 @login_required
 def export_attendance(meeting_id, fmt):
     mt = Meeting.query.get_or_404(meeting_id)
-    # prepare data rows – sort by user name
-    attendances = sorted(mt.attendances, key=lambda a: a.user.nome)
-    rows = []
-    for idx, a in enumerate(attendances, start=1):
-        rows.append({
-            'Código': idx,
-            'Nome': a.user.nome,
-            'Telefone': a.user.telefone,
-            'Região': a.user.cor,
-            'Confirmado em': a.confirmado_em.strftime('%d/%m/%Y %H:%M')
-        })
     # create a base filename from meeting title/date
     clean_name = (mt.titulo or mt.data.strftime('%d-%m-%Y')).replace(' ', '_')
-    if fmt == 'xlsx':
-        import pandas as pd, io
-        df = pd.DataFrame(rows)
-        bio = io.BytesIO()
-        df.to_excel(bio, index=False)
-        bio.seek(0)
-        return send_file(bio, download_name=f"{clean_name}.xlsx",
-                         as_attachment=True,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    elif fmt == 'pdf':
-        # build a table with headers and totals
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib import colors
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        import io
-        bio = io.BytesIO()
-        doc = SimpleDocTemplate(bio, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
-        # include logo for PDF
-        try:
-            import os
-            from reportlab.platypus import Image
-            logo_path = os.path.join(current_app.root_path, 'static', 'logo.png')
-            logo = Image(logo_path, width=100, height=100)
-            elements.append(logo)
-            elements.append(Spacer(1,6))
-        except Exception:
-            pass
-        # heading structure: main title, then meeting title and date
-        elements.append(Paragraph("Lista de presença", styles['Heading1']))
-        elements.append(Spacer(1, 6))
-        elements.append(Paragraph(mt.titulo or '', styles['Heading3']))
-        elements.append(Paragraph(mt.data.strftime('%d/%m/%Y'), styles['Heading4']))
-        elements.append(Spacer(1, 12))
-        # build table data
-        data = [['Código', 'Nome', 'Telefone', 'Região', 'Confirmado em']]
-        for row in rows:
-            data.append([row['Código'], row['Nome'], row['Telefone'], row['Região'], row['Confirmado em']])
-        # totals row inside table
-        data.append(['', '', '', 'Total presentes', len(rows)])
-        t = Table(data, repeatRows=1)
-        tbl_style = TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.black),
-                                ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-                                ('SPAN', (-2, -1), (-1, -1))])
-        t.setStyle(tbl_style)
-        elements.append(t)
-        elements.append(Spacer(1,12))
-        # summary text below table
-        elements.append(Paragraph(f"Total de presentes: {len(rows)}", styles['Normal']))
-        def footer(canvas, doc):
-            width, height = letter
-            canvas.setFont("Helvetica", 8)
-            canvas.drawString(40, 20, "Primeira Igreja Batista de Marília")
-            canvas.drawCentredString(width/2, 20, "Face a Face de Homens")
-            canvas.drawRightString(width-40, 20, str(doc.page))
-        doc.build(elements, onFirstPage=footer, onLaterPages=footer)
-        bio.seek(0)
-        return send_file(bio, download_name=f"{clean_name}.pdf",
-                         as_attachment=True,
-                         mimetype='application/pdf')
-    else:
-        abort(404)
+    if fmt in exports.STREAM_MIMETYPES:
+        # raw rows, streamed straight from the database
+        return exports.stream_response(exports.ATTENDANCE_COLUMNS,
+                                       exports.attendance_listing(meeting_id=mt.id), fmt, clean_name)
+    return _export('meeting', mt.id, fmt, clean_name)
 
 
 # export across all meetings of an event with status matrix
@@ -802,124 +792,32 @@ def export_attendance(meeting_id, fmt):
 @login_required
 def export_event_attendance(event_id, fmt):
     ev = Event.query.get_or_404(event_id)
-    meetings = sorted(ev.meetings, key=lambda m: m.data)
-    # build set of users who participated in any meeting
-    user_ids = set(a.user_id for m in meetings for a in m.attendances)
-    users = User.query.filter(User.id.in_(user_ids)).order_by(User.nome).all()
-    # header columns: Código, Nome, Telefone, Região, then one column per meeting date
-    date_cols = [m.data.strftime('%d/%m/%Y') for m in meetings]
-    rows = []
-    for idx, u in enumerate(users, start=1):
-        row = {
-            'Código': idx,
-            'Nome': u.nome,
-            'Telefone': u.telefone,
-            'Região': u.cor
-        }
-        for m in meetings:
-            attended = any(a.user_id == u.id for a in m.attendances)
-            row[m.data.strftime('%d/%m/%Y')] = 'PRESENTE' if attended else 'FALTOU'
-        rows.append(row)
     # filenames based on event name
     safe_event = ev.nome.replace(' ', '_')
-    if fmt == 'xlsx':
-        import pandas as pd, io
-        from openpyxl.styles import PatternFill
-        df = pd.DataFrame(rows)
-        # append totals row if any
-        if not df.empty:
-            total_values = {}
-            for col in date_cols:
-                present = (df[col] == 'PRESENTE').sum()
-                absent = (df[col] == 'FALTOU').sum()
-                total_values[col] = f"P {present} / F {absent}"
-            total_values.update({'Código':'','Nome':'','Telefone':'','Região':'Totais:'})
-            df = pd.concat([df, pd.DataFrame([total_values])], ignore_index=True)
-        bio = io.BytesIO()
-        with pd.ExcelWriter(bio, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Resumo')
-            wb = writer.book
-            ws = writer.sheets['Resumo']
-            # color cells based on status
-            green = PatternFill(start_color='00C6EFCE', fill_type='solid')
-            red = PatternFill(start_color='00FFC7CE', fill_type='solid')
-            # find status columns indexes
-            for col_idx, col in enumerate(df.columns, start=1):
-                if col in date_cols:
-                    for row_idx in range(2, len(df) + 2):
-                        cell = ws.cell(row=row_idx, column=col_idx)
-                        if cell.value == 'PRESENTE':
-                            cell.fill = green
-                        elif cell.value == 'FALTOU':
-                            cell.fill = red
-        bio.seek(0)
-        return send_file(bio, download_name=f"{safe_event}.xlsx",
-                         as_attachment=True,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    elif fmt == 'pdf':
-        # create a table with colored cells using reportlab
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib import colors
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        import io
-        bio = io.BytesIO()
-        doc = SimpleDocTemplate(bio, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
-        # include logo
-        try:
-            import os
-            logo_path = os.path.join(current_app.root_path, 'static', 'logo.png')
-            logo = Image(logo_path, width=100, height=100)
-            elements.append(logo)
-            elements.append(Spacer(1,6))
-        except Exception:
-            pass
-        # heading
-        elements.append(Paragraph('Lista de presença', styles['Heading1']))
-        elements.append(Spacer(1,6))
-        elements.append(Paragraph(ev.nome.upper(), styles['Heading3']))
-        elements.append(Spacer(1,12))
-        data = []
-        header = ['Código', 'Nome', 'Telefone', 'Região'] + date_cols
-        data.append(header)
-        for row in rows:
-            data.append([row[h] for h in header])
-        # summary totals row
-        if rows:
-            totals = ['','', '', 'Totais:']
-            for col in date_cols:
-                present = sum(1 for r in rows if r[col] == 'PRESENTE')
-                absent = sum(1 for r in rows if r[col] == 'FALTOU')
-                totals.append(f"P {present} / F {absent}")
-            data.append(totals)
-        t = Table(data, repeatRows=1)
-        tbl_style = TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.black)])
-        # apply backgrounds to status cells
-        for r, row in enumerate(data[1:], start=1):
-            for c, col in enumerate(header):
-                if col in date_cols:
-                    val = row[c]
-                    if val == 'PRESENTE':
-                        tbl_style.add('BACKGROUND', (c, r), (c, r), colors.lightgreen)
-                    elif val == 'FALTOU':
-                        tbl_style.add('BACKGROUND', (c, r), (c, r), colors.salmon)
-        t.setStyle(tbl_style)
-        # footer callback
-        def footer(canvas, doc):
-            width, height = letter
-            canvas.setFont("Helvetica", 8)
-            canvas.drawString(40, 20, "Primeira Igreja Batista de Marília")
-            canvas.drawCentredString(width/2, 20, "Face a Face de Homens")
-            canvas.drawRightString(width-40, 20, str(doc.page))
-        doc.build([t], onFirstPage=footer, onLaterPages=footer)
-        bio.seek(0)
-        return send_file(bio, download_name=f"{safe_event}.pdf",
-                         as_attachment=True,
-                         mimetype='application/pdf')
-    else:
-        abort(404)
+    if fmt in exports.STREAM_MIMETYPES:
+        return exports.stream_response(exports.ATTENDANCE_COLUMNS,
+                                       exports.attendance_listing(event_id=ev.id), fmt, safe_event)
+    return _export('event', ev.id, fmt, safe_event)
+
+
+@bp.route('/events/<int:event_id>/snapshot')
+@login_required
+def event_snapshot(event_id):
+    # ?format=parquet|sqlite; parquet needs pyarrow installed
+    ev = Event.query.get_or_404(event_id)
+    fmt = request.args.get('format') or snapshot.default_format()
+    if fmt in snapshot.FORMATS and fmt not in snapshot.available_formats():
+        flash('Snapshot em Parquet requer o pacote pyarrow; use o formato SQLite.', 'danger')
+        return redirect(url_for('admin.event_detail', event_id=ev.id))
+    return _export('snapshot', ev.id, fmt, f"{ev.nome.replace(' ', '_')}_snapshot")
+
+
+@bp.route('/events/<int:event_id>/bundle')
+@login_required
+def event_bundle(event_id):
+    # every meeting's list plus the event matrix, pdf and xlsx, in one zip
+    ev = Event.query.get_or_404(event_id)
+    return _export('bundle', ev.id, 'zip', f"{ev.nome.replace(' ', '_')}_relatorios")
 
 
 @bp.route('/meetings/<int:meeting_id>/delete', methods=['POST'])
@@ -933,6 +831,7 @@ def delete_meeting(meeting_id):
     event_id = mt.event_id
     db.session.delete(mt)
     db.session.commit()
+    checkin.invalidate()
     flash('Reunião excluída', 'success')
     return redirect(url_for('admin.event_detail', event_id=event_id))
 
@@ -948,6 +847,7 @@ def generate_qrcode(meeting_id):
     q = QRCode(meeting=mt, token=token, active=True)
     db.session.add(q)
     db.session.commit()
+    checkin.invalidate()
     flash('QR code gerado (anterior redirecionará para este)', 'success')
     return redirect(url_for('admin.meeting_detail', meeting_id=meeting_id))
 
@@ -956,24 +856,19 @@ def generate_qrcode(meeting_id):
 @login_required
 def qrcode_image(qrcode_id):
     qr = QRCode.query.get_or_404(qrcode_id)
-    # build URL using configured server address to avoid localhost
-    from flask import current_app
-    base = current_app.config.get('SERVER_ADDRESS')
-    url = f"{base}/scan/{qr.token}"
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    response = make_response(buf.read())
-    response.headers.set('Content-Type', 'image/png')
-    return response
+    # ?format=png|svg, ?size=<pixels>, ?ecc=L|M|Q|H; encodes
+    # SERVER_ADDRESS/scan/<token>, rendered once and cached
+    opts = qrimage.options(request.args) or abort(400)
+    return qrimage.image_response(qr.token, *opts, private=True)
 
 @bp.route('/qrcode/view/<int:qrcode_id>')
 @login_required
 def qrcode_view(qrcode_id):
     qr = QRCode.query.get_or_404(qrcode_id)
     event = qr.meeting.event
-    return render_template('qrcode_view.html', qr=qr, event=event)
+    _, _, ecc = qrimage.options(request.args) or abort(400)
+    return render_template('qrcode_view.html', qr=qr, event=event,
+                           qr_svg=qrimage.inline_svg(qr.token, ecc))
 
 
 @bp.route('/qrcode/print/<int:qrcode_id>')
@@ -981,7 +876,10 @@ def qrcode_view(qrcode_id):
 def qrcode_print(qrcode_id):
     qr = QRCode.query.get_or_404(qrcode_id)
     event = qr.meeting.event
-    return render_template('qrcode_print.html', qr=qr, event=event)
+    # vector image, sharp at any print size; ?ecc=H survives smudges
+    _, _, ecc = qrimage.options(request.args) or abort(400)
+    return render_template('qrcode_print.html', qr=qr, event=event,
+                           qr_svg=qrimage.inline_svg(qr.token, ecc))
 
 @bp.route('/qrcode/toggle/<int:qrcode_id>', methods=['POST'])
 @login_required
@@ -989,5 +887,6 @@ def qrcode_toggle(qrcode_id):
     qr = QRCode.query.get_or_404(qrcode_id)
     qr.active = not qr.active
     db.session.commit()
+    checkin.invalidate()
     flash('QR code atualizado', 'success')
     return redirect(url_for('admin.meeting_detail', meeting_id=qr.meeting.id))
@@ -0,0 +1,146 @@
+"""Async database access for the check-in views (opt-in via ASYNC_CHECKIN).
+
+Flask runs an ``async def`` view by creating a fresh event loop per call,
+which would force a new database connection for every request.  Instead,
+every coroutine is submitted to one long-lived loop running in a daemon
+thread, so the async engine (aiosqlite locally, aiomysql in production)
+keeps a real connection pool and overlaps the I/O of concurrent requests.
+Requires: asgiref, aiosqlite / aiomysql (see requirements.txt).
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+
+from sqlalchemy import select as db_select
+from sqlalchemy.engine import make_url
+
+
+# sync driver -> async driver for the same database
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'mysql+mysqldb': 'mysql+aiomysql',
+}
+
+# (endpoint, module, async view name) swapped in by init_app
+ASYNC_VIEWS = [
+    ('main.scan', 'app.main.routes', 'scan_async'),
+    ('main.register', 'app.main.routes', 'register_async'),
+    ('api.post_attendance', 'app.api', 'post_attendance_async'),
+]
+
+
+def async_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    if driver is None:
+        if '+' in url.drivername and url.drivername.split('+')[1].startswith('aio'):
+            return url
+        raise ValueError(f'no async driver known for {url.drivername}')
+    return url.set(drivername=driver)
+
+
+class EventLoopThread:
+    """One event loop shared by every request thread of the process."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name='async-checkin', daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        # run the coroutine with a copy of the caller's context so Flask's
+        # request/app context (contextvars) is visible inside it
+        ctx = contextvars.copy_context()
+        result = concurrent.futures.Future()
+
+        def start():
+            task = self.loop.create_task(coro, context=ctx)
+
+            def done(t):
+                if t.cancelled():
+                    result.cancel()
+                elif t.exception() is not None:
+                    result.set_exception(t.exception())
+                else:
+                    result.set_result(t.result())
+            task.add_done_callback(done)
+
+        self.loop.call_soon_threadsafe(start)
+        return result.result()
+
+    def async_to_sync(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+
+def session(app=None):
+    """New AsyncSession bound to the app's async engine."""
+    from flask import current_app
+    app = app or current_app
+    return app.extensions['aio']['sessionmaker']()
+
+
+def init_app(app):
+    if not app.config.get('ASYNC_CHECKIN'):
+        return
+    import importlib
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    engine = create_async_engine(async_url(app.config['SQLALCHEMY_DATABASE_URI']),
+                                 pool_pre_ping=True)
+    runner = EventLoopThread()
+    app.extensions['aio'] = {
+        'engine': engine,
+        'sessionmaker': async_sessionmaker(engine, expire_on_commit=False),
+        'runner': runner,
+    }
+    # Flask calls app.async_to_sync for every async view
+    app.async_to_sync = runner.async_to_sync
+    for endpoint, module, name in ASYNC_VIEWS:
+        app.view_functions[endpoint] = getattr(importlib.import_module(module), name)
+
+
+async def resolve(s, token):
+    """Async counterpart of checkin.resolve, sharing the same token cache."""
+    from app import checkin
+    entry = checkin.cached(token)
+    if entry is None:
+        row = (await s.execute(checkin.token_query(token))).first()
+        if row is not None:
+            replacement = None
+            if not row[0]:
+                replacement = (await s.execute(checkin.replacement_query(row[1]))).scalar()
+            entry = checkin.make_entry(token, row, replacement)
+        checkin.remember(token, entry)
+    return entry
+
+
+async def user_by_phone(s, value):
+    from app.models import User, phone_digits
+    digits = phone_digits(value)
+    if not digits:
+        return None
+    return (await s.execute(db_select(User).filter_by(telefone_digits=digits).limit(1))).scalar()
+
+
+async def record_attendance(s, meeting_id, user_id, confirmado_em=None):
+    """Async counterpart of checkin.record_attendance; the caller commits."""
+    from app import checkin, stats
+    from app.models import Attendance
+    values = {'meeting_id': meeting_id, 'user_id': user_id}
+    if confirmado_em is not None:
+        values['confirmado_em'] = confirmado_em
+    stmt = checkin.insert_ignore(Attendance.__table__, s.bind.dialect.name).values(**values)
+    result = await s.execute(stmt)
+    if result.rowcount != 1:
+        return None
+    att_id = result.inserted_primary_key[0]
+    await s.execute(stats.count_stmt(meeting_id, user_id, att_id, s.bind.dialect.name))
+    return att_id
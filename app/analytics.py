@@ -0,0 +1,123 @@
+"""Retention analytics over per-meeting attendance bitsets.
+
+Every participant who ever attended gets a dense ordinal (0..n-1, in user
+id order) and every meeting an int whose bit i is set when participant i
+was there.  First-timers, returning attendees, streaks and event cohorts
+are then AND/OR/popcount over those ints instead of building sets of
+user ids per question.
+
+The report is built from one query over attendance and kept in app.cache
+until the next write to the data.
+"""
+from collections import namedtuple
+
+from app import db, cache, stats
+from app.models import Attendance
+
+
+# longest run of consecutive meetings reported per meeting
+STREAK_MAX = 5
+
+AttendanceIndex = namedtuple('AttendanceIndex', 'meetings bits participants')
+
+
+def build_index():
+    """Meetings in dashboard order, with one attendance bitset each."""
+    meetings = stats.ordered_meetings()
+    ordinals = {uid: i for i, (uid,) in enumerate(
+        db.session.query(Attendance.user_id).distinct().order_by(Attendance.user_id))}
+    size = (len(ordinals) + 7) // 8
+    buffers = {mt.id: bytearray(size) for mt, _ in meetings}
+    for mid, uid in db.session.query(Attendance.meeting_id, Attendance.user_id).yield_per(5000):
+        buf = buffers.get(mid)
+        if buf is not None:
+            o = ordinals[uid]
+            buf[o >> 3] |= 1 << (o & 7)
+    bits = [int.from_bytes(buffers[mt.id], 'little') for mt, _ in meetings]
+    return AttendanceIndex(meetings, bits, len(ordinals))
+
+
+def meeting_retention(index, streak_max=STREAK_MAX):
+    """Per meeting: total, first-timers (never seen at an earlier meeting),
+    returning, retained from the previous meeting and streaks, where
+    streaks[k] counts attendees present at this and the k+1 meetings
+    right before it."""
+    rows = []
+    seen = 0
+    history = []
+    for (mt, ev), bits in zip(index.meetings, index.bits):
+        total = bits.bit_count()
+        first = (bits & ~seen).bit_count()
+        prev = history[-1] if history else 0
+        streaks = []
+        run = bits
+        for past in reversed(history[-(streak_max - 1):]):
+            run &= past
+            streaks.append(run.bit_count())
+        streaks += [0] * (streak_max - 1 - len(streaks))
+        rows.append({'event': ev, 'meeting': mt, 'total': total, 'first_timers': first,
+                     'returning': total - first, 'from_previous': (bits & prev).bit_count(),
+                     'streaks': streaks})
+        seen |= bits
+        history.append(bits)
+    return rows
+
+
+def event_retention(index):
+    """Per event: participants, newcomers, retained from the previous event
+    and the cohort row (how many of the event's newcomers came back to each
+    later event, starting with the event itself)."""
+    events = []
+    event_bits = []
+    for (mt, ev), bits in zip(index.meetings, index.bits):
+        if events and events[-1].id == ev.id:
+            event_bits[-1] |= bits
+        else:
+            events.append(ev)
+            event_bits.append(bits)
+    rows = []
+    seen = 0
+    for i, (ev, bits) in enumerate(zip(events, event_bits)):
+        total = bits.bit_count()
+        cohort = bits & ~seen
+        prev = event_bits[i - 1] if i else 0
+        prev_total = prev.bit_count()
+        retained = (bits & prev).bit_count()
+        rows.append({'event': ev, 'participants': total, 'newcomers': cohort.bit_count(),
+                     'from_previous': retained,
+                     'retention': round(retained / prev_total, 3) if prev_total else None,
+                     'cohort': [(cohort & later).bit_count() for later in event_bits[i:]]})
+        seen |= bits
+    return rows
+
+
+def _report():
+    index = build_index()
+    return {'participants': index.participants,
+            'meetings': meeting_retention(index),
+            'events': event_retention(index)}
+
+
+def report(last_events=None):
+    """Cached analytics, optionally limited to the most recent events
+    (first-timers and cohorts still account for the whole history)."""
+    data, _ = cache.get().get_or_compute(('analytics',), _report)
+    if not last_events:
+        return data
+    events = data['events'][-last_events:]
+    keep = {row['event'].id for row in events}
+    return dict(data, events=events,
+                meetings=[row for row in data['meetings'] if row['event'].id in keep])
+
+
+def as_json(data):
+    def meeting(m):
+        return {'id': m.id, 'titulo': m.titulo, 'data': m.data.isoformat()}
+    return {
+        'participants': data['participants'],
+        'streak_lengths': list(range(2, STREAK_MAX + 1)),
+        'meetings': [dict(row, event={'id': row['event'].id, 'nome': row['event'].nome},
+                          meeting=meeting(row['meeting'])) for row in data['meetings']],
+        'events': [dict(row, event={'id': row['event'].id, 'nome': row['event'].nome})
+                   for row in data['events']],
+    }
@@ -1,6 +1,8 @@
+from collections import Counter
+from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
-from app.models import Event, User, Attendance, Setting, QRCode
-from app import db
+from app.models import Event, User, Attendance, Setting, QRCode, Region
+from app import db, checkin, live, exports
 
 bp = Blueprint('api', __name__)
 
@@ -17,16 +19,55 @@ def require_token():
     if not check_token():
         return jsonify({'error': 'invalid or missing API token'}), 401
 
+def stream_format(default=None):
+    # ?format=csv|ndjson (and json for listings streamed by default)
+    fmt = request.args.get('format', default)
+    return fmt if fmt in exports.STREAM_MIMETYPES else None
+
+
+def int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return False
+
 @bp.route('/events', methods=['GET'])
 def get_events():
+    fmt = stream_format()
+    if fmt:
+        rows = (db.session.query(Event.id, Event.nome, Event.data_inicial, Event.data_final)
+                .order_by(Event.id).yield_per(exports.FETCH_SIZE))
+        return exports.stream_response(['id', 'nome', 'data_inicial', 'data_final'], rows, fmt)
     evs = Event.query.all()
     return jsonify([{'id':e.id, 'nome':e.nome, 'data_inicial':e.data_inicial.isoformat(), 'data_final':e.data_final.isoformat()} for e in evs])
 
 @bp.route('/users', methods=['GET'])
 def get_users():
+    fmt = stream_format()
+    if fmt:
+        rows = (db.session.query(User.id, User.telefone, User.nome, Region.nome)
+                .outerjoin(Region, User.region_id == Region.id)
+                .order_by(User.id).yield_per(exports.FETCH_SIZE))
+        return exports.stream_response(['id', 'telefone', 'nome', 'region'], rows, fmt)
     users = User.query.all()
     return jsonify([{'id':u.id, 'telefone':u.telefone, 'nome':u.nome, 'region':u.region.nome if u.region else None} for u in users])
 
+@bp.route('/attendance', methods=['GET'])
+def get_attendance():
+    # full listing, streamed; filter with meeting_id, event_id and after_id
+    # (only rows with a greater id, for incremental pulls)
+    fmt = stream_format('json')
+    if fmt is None:
+        return jsonify({'error': 'format must be json, ndjson or csv'}), 400
+    filters = {name: int_arg(name) for name in ('meeting_id', 'event_id', 'after_id')}
+    bad = [name for name, value in filters.items() if value is False]
+    if bad:
+        return jsonify({'error': f'{bad[0]} must be an integer'}), 400
+    return exports.stream_response(exports.ATTENDANCE_COLUMNS, exports.attendance_listing(**filters), fmt)
+
 @bp.route('/attendance', methods=['POST'])
 def post_attendance():
     data = request.json or {}
@@ -35,17 +76,61 @@ def post_attendance():
     if not token or not telefone:
         return jsonify({'error': 'token and telefone required'}), 400
     q = current_app.extensions['sqlalchemy'].db.session
-    qr = q.query(QRCode).filter_by(token=token).first()
-    if not qr or not qr.active:
+    entry = checkin.resolve(token)
+    if not entry or not entry.active:
         return jsonify({'error': 'invalid qrcode'}), 404
-    meeting = qr.meeting
-    user = q.query(User).filter_by(telefone=telefone).first()
+    meeting = entry.meeting
+    user = User.by_phone(telefone)
     if not user:
         return jsonify({'error': 'user not found'}), 404
-    existing = q.query(Attendance).filter_by(meeting=meeting, user=user).first()
-    if existing:
-        return jsonify({'status': 'already registered'})
-    att = Attendance(meeting=meeting, user=user)
-    q.add(att)
+    confirmado_em = datetime.utcnow()
+    att_id = checkin.record_attendance(meeting.id, user.id, confirmado_em=confirmado_em)
     q.commit()
+    if att_id is None:
+        return jsonify({'status': 'already registered'})
+    live.attendance_added(meeting.id, user, confirmado_em, att_id)
+    return jsonify({'status': 'ok'})
+
+
+
+async def post_attendance_async():
+    # swapped in for post_attendance by app.aio when ASYNC_CHECKIN is set
+    from app import aio
+    data = request.json or {}
+    token = data.get('token')
+    telefone = data.get('telefone')
+    if not token or not telefone:
+        return jsonify({'error': 'token and telefone required'}), 400
+    async with aio.session() as s:
+        entry = await aio.resolve(s, token)
+        if not entry or not entry.active:
+            return jsonify({'error': 'invalid qrcode'}), 404
+        user = await aio.user_by_phone(s, telefone)
+        if not user:
+            return jsonify({'error': 'user not found'}), 404
+        confirmado_em = datetime.utcnow()
+        att_id = await aio.record_attendance(s, entry.meeting.id, user.id, confirmado_em=confirmado_em)
+        await s.commit()
+    if att_id is None:
+        return jsonify({'status': 'already registered'})
+    live.attendance_added(entry.meeting.id, user, confirmado_em, att_id)
     return jsonify({'status': 'ok'})
+
+@bp.route('/attendance/batch', methods=['POST'])
+def post_attendance_batch():
+    # replay of check-ins queued offline by scanner devices:
+    # json=[{"token": "<qrcode>", "telefone": "...", "scanned_at": "<iso>"}, ...]
+    data = request.get_json(silent=True)
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({'error': 'list of records required'}), 400
+    limit = current_app.config.get('API_BATCH_MAX', 10000)
+    if len(records) > limit:
+        return jsonify({'error': f'at most {limit} records per batch'}), 413
+    statuses, rows = checkin.record_batch(records)
+    db.session.commit()
+    if rows and live.listening({r['meeting_id'] for r in rows}):
+        users = {u.id: u for u in User.query.filter(User.id.in_({r['user_id'] for r in rows})).all()}
+        for r in rows:
+            live.attendance_added(r['meeting_id'], users[r['user_id']], r['confirmado_em'], r['id'])
+    return jsonify({'results': statuses, 'totals': dict(Counter(statuses))})
@@ -0,0 +1,196 @@
+"""Arrival curves from Attendance.confirmado_em, for sizing door staffing.
+
+Per meeting: check-ins per minute since the first check-in, peak rate,
+minutes until 50% and 90% of the final attendance had arrived, and the
+share of late arrivals (more than ARRIVAL_LATE_MINUTES after the first
+check-in) per region (user.cor).  The per-minute curve stops at the late
+threshold; every later check-in goes into one trailing bucket, so a
+stray check-in hours afterwards does not stretch it.  Per event, the meeting reports are
+combined.
+
+Rows are pulled as columns (meeting_id, cor, confirmado_em) into a pandas
+DataFrame and every metric is a grouped/vectorized operation.  Reports of
+closed meetings (date before today) are cached per meeting, checked
+against the meeting's meeting_stats rows so a later delete or colour
+change still shows up.
+"""
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.models import Attendance, MeetingStat, User
+
+
+# closed-meeting reports kept per process
+CACHE_SIZE = 1024
+
+_closed = OrderedDict()
+_lock = threading.Lock()
+
+
+def _today():
+    from zoneinfo import ZoneInfo
+    return datetime.now(ZoneInfo('America/Sao_Paulo')).date()
+
+
+def _fingerprints(meeting_ids):
+    rows = (db.session.query(MeetingStat.meeting_id, MeetingStat.cor, MeetingStat.total)
+            .filter(MeetingStat.meeting_id.in_(meeting_ids), MeetingStat.total > 0)
+            .order_by(MeetingStat.meeting_id, MeetingStat.cor).all())
+    prints = {mid: () for mid in meeting_ids}
+    for mid, cor, total in rows:
+        prints[mid] += ((cor, total),)
+    return prints
+
+
+def _frame(meeting_ids):
+    import pandas as pd
+    rows = (db.session.query(Attendance.meeting_id, User.cor, Attendance.confirmado_em)
+            .join(User, Attendance.user_id == User.id)
+            .filter(Attendance.meeting_id.in_(meeting_ids),
+                    Attendance.confirmado_em.isnot(None))
+            .all())
+    meeting, cor, ts = zip(*rows) if rows else ((), (), ())
+    return pd.DataFrame({'meeting_id': pd.Series(meeting, dtype='int64'),
+                         'cor': pd.Series(cor, dtype='object'),
+                         'ts': pd.to_datetime(pd.Series(ts, dtype='object'))})
+
+
+def _compute(meeting_ids, late_minutes):
+    """Reports for the given meetings, from one columnar query."""
+    import numpy as np
+    df = _frame(meeting_ids)
+    reports = {mid: _empty(mid, late_minutes) for mid in meeting_ids}
+    if df.empty:
+        return reports
+    first = df.groupby('meeting_id')['ts'].transform('min')
+    df['offset'] = (df['ts'] - first).dt.total_seconds() / 60.0
+    # minutes past the late threshold share the trailing bucket
+    window = max(late_minutes, 1)
+    df['minute'] = df['offset'].astype('int64').clip(upper=window)
+    df['late'] = df['offset'] > late_minutes
+    df = df.sort_values(['meeting_id', 'offset'], kind='stable')
+    grouped = df.groupby('meeting_id')
+    df['rank'] = grouped.cumcount() + 1
+    size = grouped['ts'].transform('size')
+
+    def reached(share):
+        # offset of the check-in that brought the meeting to `share` of its total
+        hit = df[df['rank'] >= np.ceil(share * size)]
+        return hit.groupby('meeting_id')['offset'].first()
+
+    t50, t90 = reached(0.5), reached(0.9)
+    summary = grouped.agg(checkins=('ts', 'size'), first=('ts', 'min'), last=('ts', 'max'),
+                          late=('late', 'sum'))
+    per_minute = df.groupby(['meeting_id', 'minute']).size()
+    by_region = df.groupby(['meeting_id', 'cor'])['late'].agg(['size', 'sum'])
+
+    for mid, row in summary.iterrows():
+        counts = per_minute.loc[mid]
+        curve = np.zeros(int(counts.index.max()) + 1, dtype='int64')
+        curve[counts.index.to_numpy()] = counts.to_numpy()
+        minutes = curve[:window]
+        regions = by_region.loc[mid]
+        reports[mid] = {
+            'meeting_id': int(mid),
+            'checkins': int(row['checkins']),
+            'first': row['first'].isoformat(),
+            'last': row['last'].isoformat(),
+            'per_minute': curve.tolist(),
+            'peak_per_minute': int(minutes.max()),
+            'peak_minute': int(minutes.argmax()),
+            'minutes_to_50': round(float(t50[mid]), 1),
+            'minutes_to_90': round(float(t90[mid]), 1),
+            'late_after_minutes': late_minutes,
+            'late': int(row['late']),
+            'late_share': round(float(row['late']) / row['checkins'], 3),
+            'late_by_region': {cor: {'checkins': int(r['size']), 'late': int(r['sum']),
+                                     'share': round(float(r['sum']) / r['size'], 3)}
+                               for cor, r in regions.iterrows()},
+        }
+    return reports
+
+
+def _empty(meeting_id, late_minutes):
+    return {'meeting_id': meeting_id, 'checkins': 0, 'first': None, 'last': None,
+            'per_minute': [], 'peak_per_minute': 0, 'peak_minute': None,
+            'minutes_to_50': None, 'minutes_to_90': None,
+            'late_after_minutes': late_minutes, 'late': 0, 'late_share': None,
+            'late_by_region': {}}
+
+
+def meeting_reports(meetings):
+    """Reports for a list of Meeting rows, keyed by meeting id; closed
+    meetings come from the per-meeting cache when still current."""
+    late_minutes = current_app.config['ARRIVAL_LATE_MINUTES']
+    today = _today()
+    ids = [mt.id for mt in meetings]
+    closed = {mt.id for mt in meetings if mt.data < today}
+    prints = _fingerprints(ids) if ids else {}
+    reports = {}
+    with _lock:
+        for mid in closed:
+            hit = _closed.get((mid, late_minutes))
+            if hit is not None and hit[0] == prints[mid]:
+                _closed.move_to_end((mid, late_minutes))
+                reports[mid] = hit[1]
+    missing = [mid for mid in ids if mid not in reports]
+    if missing:
+        fresh = _compute(missing, late_minutes)
+        reports.update(fresh)
+        with _lock:
+            for mid in missing:
+                if mid in closed:
+                    _closed[(mid, late_minutes)] = (prints[mid], fresh[mid])
+                    _closed.move_to_end((mid, late_minutes))
+            while len(_closed) > CACHE_SIZE:
+                _closed.popitem(last=False)
+    return reports
+
+
+def meeting_report(meeting):
+    return meeting_reports([meeting])[meeting.id]
+
+
+def event_report(event):
+    """The event's meeting reports plus their combination: the mean
+    check-ins per minute across meetings, the worst peak, and minutes to
+    50%/90% and late shares over all check-ins (1-minute resolution; a
+    share reached only in the trailing bucket shows as the late threshold
+    plus one)."""
+    import numpy as np
+    meetings = sorted(event.meetings, key=lambda m: (m.data, m.id))
+    reports = meeting_reports(meetings)
+    rows = [dict(reports[mt.id], titulo=mt.titulo or mt.data.strftime('%d/%m/%Y'),
+                 data=mt.data.isoformat()) for mt in meetings]
+    curves = [np.array(r['per_minute'], dtype='int64') for r in rows if r['checkins']]
+    combined = {'meetings_with_checkins': len(curves), 'checkins': sum(r['checkins'] for r in rows),
+                'mean_per_minute': [], 'peak_per_minute': 0, 'minutes_to_50': None,
+                'minutes_to_90': None, 'late': 0, 'late_share': None, 'late_by_region': {}}
+    if curves:
+        pooled = np.zeros(max(len(c) for c in curves), dtype='int64')
+        for c in curves:
+            pooled[:len(c)] += c
+        cumulative = np.cumsum(pooled)
+        total = int(cumulative[-1])
+        combined['mean_per_minute'] = np.round(pooled / len(curves), 2).tolist()
+        combined['peak_per_minute'] = max(r['peak_per_minute'] for r in rows)
+        # minute in which the pooled check-ins reached the share, counted to its end
+        combined['minutes_to_50'] = int(np.searchsorted(cumulative, np.ceil(0.5 * total))) + 1
+        combined['minutes_to_90'] = int(np.searchsorted(cumulative, np.ceil(0.9 * total))) + 1
+        combined['late'] = sum(r['late'] for r in rows)
+        combined['late_share'] = round(combined['late'] / total, 3)
+        regions = {}
+        for r in rows:
+            for cor, v in r['late_by_region'].items():
+                acc = regions.setdefault(cor, {'checkins': 0, 'late': 0})
+                acc['checkins'] += v['checkins']
+                acc['late'] += v['late']
+        combined['late_by_region'] = {cor: dict(v, share=round(v['late'] / v['checkins'], 3))
+                                      for cor, v in regions.items()}
+    return {'event_id': event.id, 'nome': event.nome,
+            'late_after_minutes': current_app.config['ARRIVAL_LATE_MINUTES'],
+            'combined': combined, 'meetings': rows}
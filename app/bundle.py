@@ -0,0 +1,156 @@
+"""One ZIP with every attendance report of an event.
+
+The bundle holds the event matrix ('Resumo') and each meeting's
+attendance list, all as PDF and XLSX.  Rows are read here, in the export
+thread; rendering them (reportlab, openpyxl) is CPU bound and runs in a
+pool of BUNDLE_PROCESSES worker processes.  Every rendered part is kept
+in EXPORT_DIR under a hash of what it shows (title, date and rows), so
+after a check-in only the meetings whose attendance changed, and the
+matrix, are rendered again; the other parts come from disk.  Parts go
+into the ZIP as they are ready and the job reports (done, total).
+"""
+import hashlib
+import multiprocessing
+import os
+import secrets
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+from app import db, exports
+from app.models import Event
+
+
+FORMATS = ('pdf', 'xlsx')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool(processes):
+    """The worker processes, started on first use and kept."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a server with running threads and open
+            # database connections is not safe
+            _pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _drop_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def render(part, fmt, path):
+    """Render a part to `path`; runs in a worker, without an app context.
+
+    part is ('meeting', titulo, data, rows, logo) or
+    ('event', nome, header, rows, logo).
+    """
+    kind, name, extra, rows, logo_file = part
+    if kind == 'meeting':
+        result = (exports.list_workbook(rows) if fmt == 'xlsx'
+                  else exports.list_pdf(name, extra, rows, logo_file))
+    else:
+        result = (exports.matrix_workbook(extra, rows) if fmt == 'xlsx'
+                  else exports.matrix_pdf(name, extra, rows, logo_file))
+    tmp = f'{path}.{secrets.token_hex(4)}.tmp'
+    try:
+        exports.save(result, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def _name(text):
+    return text.replace('/', '-').replace(' ', '_')
+
+
+class Bundle:
+    """Deferred bundle of an event, saved by app.jobs."""
+
+    def __init__(self, event_id, directory):
+        self.event_id = event_id
+        self.directory = directory
+
+    def parts(self):
+        """(file name in the ZIP, part) for the matrix and each meeting,
+        reading one meeting's rows at a time."""
+        ev = db.session.get(Event, self.event_id)
+        meetings = sorted(ev.meetings, key=lambda m: m.data)
+        logo_file = exports.logo_path()
+        folder = _name(ev.nome)
+        header, rows = exports.event_table(meetings)
+        yield f'{folder}/Resumo', ('event', ev.nome, header, list(rows), logo_file)
+        names = set()
+        for mt in meetings:
+            name = f"{mt.data.strftime('%Y-%m-%d')}_{_name(mt.titulo or '')}".rstrip('_')
+            if name in names:
+                name = f'{name}_{mt.id}'
+            names.add(name)
+            yield (f'{folder}/{name}',
+                   ('meeting', mt.titulo, mt.data, list(exports.meeting_rows(mt.id)), logo_file))
+
+    def _cached(self, part, fmt):
+        # the logo path is left out: it differs between deployments, not renders
+        digest = hashlib.sha1(repr((fmt,) + part[:4]).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'part-{digest}.{fmt}')
+
+    def total(self):
+        ev = db.session.get(Event, self.event_id)
+        return (len(ev.meetings) + 1) * len(FORMATS)
+
+    def save(self, path, progress=None):
+        """Write the ZIP to `path`, calling progress(done, total) as parts
+        are added."""
+        total = self.total()
+        done = 0
+        report = progress or (lambda done, total: None)
+        report(done, total)
+        processes = current_app.config.get('BUNDLE_PROCESSES', os.cpu_count() or 1)
+        executor = pool(processes) if processes > 0 else None
+        futures = {}
+        with zipfile.ZipFile(path, 'w') as zf:
+
+            def add(name, fmt, cached):
+                nonlocal done
+                # xlsx files are zip archives already
+                zf.write(cached, f'{name}.{fmt}', compress_type=zipfile.ZIP_DEFLATED
+                         if fmt == 'pdf' else zipfile.ZIP_STORED)
+                done += 1
+                report(done, total)
+
+            try:
+                for name, part in self.parts():
+                    for fmt in FORMATS:
+                        cached = self._cached(part, fmt)
+                        if os.path.exists(cached):
+                            try:
+                                # recently used: last in line for eviction
+                                os.utime(cached)
+                                add(name, fmt, cached)
+                                continue
+                            except FileNotFoundError:
+                                pass
+                        if executor is None:
+                            add(name, fmt, render(part, fmt, cached))
+                        else:
+                            futures[executor.submit(render, part, fmt, cached)] = (name, fmt)
+                for future in as_completed(futures):
+                    name, fmt = futures[future]
+                    add(name, fmt, future.result())
+            except BrokenProcessPool:
+                # a worker died; start a fresh pool next time
+                _drop_pool()
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
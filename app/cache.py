@@ -0,0 +1,183 @@
+"""Versioned in-process cache for read-mostly admin data (the dashboard).
+
+Entries are keyed by the caller's key plus a global data version, a
+counter bumped after every committed write to the tables the dashboard
+reads.  A hit is therefore always current and nothing is invalidated by
+hand: entries of older versions simply fall out of the LRU.
+
+Writes are noticed through SQLAlchemy session events (ORM flushes, Core
+DML and raw SQL alike), so new write paths need no extra calls.  The
+counter lives in memory by default; set DATA_VERSION_URL to a redis://
+URL (requires the `redis` package) so every worker sees the same version.
+Each worker keeps its own LRU.
+"""
+import re
+import secrets
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+
+# a committed write to any of these bumps the data version
+WATCHED_TABLES = {'attendance', 'meeting_stats', 'user', 'meeting', 'event', 'region', 'qr_code',
+                  'team', 'team_user'}
+_WATCHED_RE = re.compile(r'\b(%s)\b' % '|'.join(sorted(WATCHED_TABLES)), re.IGNORECASE)
+_DML_RE = re.compile(r'^\s*(insert|update|delete|replace)\b', re.IGNORECASE)
+
+
+class MemoryVersion:
+    """Data version for a single process."""
+
+    def __init__(self):
+        self._value = 0
+        # versions only mean something within this process
+        self.scope = secrets.token_hex(8)
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._value
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class RedisVersion:
+    """Data version shared by every worker through Redis."""
+
+    def __init__(self, url, key='f2f:data-version'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        # names this counter; a flushed Redis starts a new one (and scope)
+        self.client.set(f'{key}:scope', secrets.token_hex(8), nx=True)
+        self.scope = self.client.get(f'{key}:scope').decode()
+
+    def get(self):
+        return int(self.client.get(self.key) or 0)
+
+    def bump(self):
+        return self.client.incr(self.key)
+
+
+def make_version_store(url):
+    if not url or url.startswith('memory://'):
+        return MemoryVersion()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisVersion(url)
+    raise ValueError(f'unsupported DATA_VERSION_URL: {url}')
+
+
+class VersionedCache:
+    """Bounded LRU whose keys carry the current data version."""
+
+    def __init__(self, versions, max_entries=64):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Cached value for `key` at the current version, computing it on a
+        miss.  Returns (value, hit)."""
+        # read the version first: a write committed while computing bumps it,
+        # so the (possibly older) result is never served under the new version
+        full_key = (key, self.versions.get())
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key], True
+            self.misses += 1
+        value = compute()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[full_key] = value
+                self._entries.move_to_end(full_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value, False
+
+    def bump(self):
+        return self.versions.bump()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+                'size': size, 'max_entries': self.max_entries,
+                'version': self.versions.get()}
+
+
+def get(app=None):
+    app = app or current_app
+    return app.extensions.get('cache')
+
+
+def _writes_watched(statement):
+    if isinstance(statement, TextClause):
+        sql = statement.text
+        return bool(_DML_RE.match(sql) and _WATCHED_RE.search(sql))
+    if getattr(statement, 'is_dml', False):
+        table = getattr(statement, 'table', None)
+        return getattr(table, 'name', None) in WATCHED_TABLES
+    return False
+
+
+def _on_execute(state):
+    if not _writes_watched(state.statement):
+        return None
+    result = state.invoke_statement()
+    # a duplicate check-in (INSERT IGNORE matching nothing) changes no data
+    if getattr(result, 'rowcount', -1) != 0:
+        state.session.info['data_changed'] = True
+    return result
+
+
+def _after_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, '__table__', None)
+        if getattr(table, 'name', None) in WATCHED_TABLES:
+            session.info['data_changed'] = True
+            return
+
+
+def _after_commit(session):
+    if not session.info.pop('data_changed', False):
+        return
+    if has_app_context():
+        cache = get()
+        if cache is not None:
+            cache.bump()
+
+
+def _after_rollback(session):
+    session.info.pop('data_changed', None)
+
+
+def _listen():
+    # on the base Session class so Flask-SQLAlchemy's sessions and the
+    # sync side of app.aio's AsyncSessions are both covered
+    for name, fn in (('do_orm_execute', _on_execute), ('after_flush', _after_flush),
+                     ('after_commit', _after_commit), ('after_rollback', _after_rollback)):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
+
+
+def init_app(app):
+    app.extensions['cache'] = VersionedCache(make_version_store(app.config.get('DATA_VERSION_URL')),
+                                             app.config.get('DASHBOARD_CACHE_SIZE', 64))
+    _listen()
@@ -0,0 +1,294 @@
+"""Helpers shared by the public check-in flow (scan, register and the API)."""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from app import db, stats
+from app.models import QRCode, Meeting, Event, Attendance, User, phone_digits
+
+
+# lightweight, session-independent copies of the rows the check-in pages need
+CachedEvent = namedtuple('CachedEvent', 'id nome data_final')
+CachedMeeting = namedtuple('CachedMeeting', 'id titulo data event')
+TokenEntry = namedtuple('TokenEntry', 'token meeting active replacement loaded_at')
+CachedQR = namedtuple('CachedQR', 'id token')
+OpenSnapshot = namedtuple('OpenSnapshot', 'meetings valid_until loaded_at')
+
+_tokens = {}
+_open_snapshot = None
+_lock = threading.Lock()
+
+
+def token_query(token):
+    return (db.select(QRCode.active, Meeting.id, Meeting.titulo, Meeting.data,
+                      Event.id, Event.nome, Event.data_final)
+            .join(Meeting, QRCode.meeting_id == Meeting.id)
+            .join(Event, Meeting.event_id == Event.id)
+            .where(QRCode.token == token).limit(1))
+
+
+def replacement_query(meeting_id):
+    return (db.select(QRCode.token)
+            .where(QRCode.meeting_id == meeting_id, QRCode.active.is_(True)).limit(1))
+
+
+def make_entry(token, row, replacement):
+    active, mt_id, titulo, data, ev_id, ev_nome, ev_final = row
+    meeting = CachedMeeting(mt_id, titulo, data, CachedEvent(ev_id, ev_nome, ev_final))
+    return TokenEntry(token, meeting, bool(active), replacement, time.monotonic())
+
+
+def _load(token):
+    row = db.session.execute(token_query(token)).first()
+    if row is None:
+        return None
+    replacement = None
+    if not row[0]:
+        replacement = db.session.execute(replacement_query(row[1])).scalar()
+    return make_entry(token, row, replacement)
+
+
+def cached(token):
+    """Fresh cache entry for token, or None when it must be (re)loaded."""
+    ttl = current_app.config.get('QR_CACHE_TTL', 30)
+    entry = _tokens.get(token)
+    if entry is not None and time.monotonic() - entry.loaded_at < ttl:
+        return entry
+    return None
+
+
+def remember(token, entry):
+    # unknown tokens are not cached so random probing can't grow the table
+    with _lock:
+        if entry is None:
+            _tokens.pop(token, None)
+        else:
+            _tokens[token] = entry
+
+
+def resolve(token):
+    """Return the cached TokenEntry for a QR token, or None if it doesn't exist."""
+    entry = cached(token)
+    if entry is None:
+        entry = _load(token)
+        remember(token, entry)
+    return entry
+
+
+def invalidate():
+    """Drop every cached token and the open-meetings snapshot; call after QR
+    codes, meetings or events change."""
+    global _open_snapshot
+    with _lock:
+        _tokens.clear()
+        _open_snapshot = None
+
+
+def _next_boundary(now):
+    """Next instant at which is_closed() can flip for some meeting: the
+    18h opening, the end of 23h30, or midnight (new day, events ending)."""
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    for boundary in (day.replace(hour=18), day.replace(hour=23, minute=31)):
+        if now < boundary:
+            return boundary
+    return day + timedelta(days=1)
+
+
+def _build_open_snapshot(now):
+    rows = (db.session.query(QRCode.id, QRCode.token, Meeting.id, Meeting.titulo, Meeting.data,
+                             Event.id, Event.nome, Event.data_final)
+            .join(Meeting, QRCode.meeting_id == Meeting.id)
+            .join(Event, Meeting.event_id == Event.id)
+            .filter(QRCode.active.is_(True), Event.data_final >= now.date())
+            .order_by(QRCode.id).all())
+    loaded_at = time.monotonic()
+    meetings = []
+    for qr_id, token, mt_id, titulo, data, ev_id, ev_nome, ev_final in rows:
+        meeting = CachedMeeting(mt_id, titulo, data, CachedEvent(ev_id, ev_nome, ev_final))
+        entry = TokenEntry(token, meeting, True, None, loaded_at)
+        if not is_closed(entry, now):
+            meetings.append((meeting, CachedQR(qr_id, token)))
+    return OpenSnapshot(meetings, _next_boundary(now), loaded_at)
+
+
+def open_meetings(now=None):
+    """(meeting, qrcode) pairs currently accepting check-ins, for the index page.
+
+    Served from a snapshot that is rebuilt when invalidate() runs, when the
+    next window boundary passes, or after QR_CACHE_TTL (other workers' edits).
+    """
+    global _open_snapshot
+    now = now or datetime.utcnow()
+    ttl = current_app.config.get('QR_CACHE_TTL', 30)
+    snap = _open_snapshot
+    if snap is None or now >= snap.valid_until or time.monotonic() - snap.loaded_at >= ttl:
+        snap = _build_open_snapshot(now)
+        with _lock:
+            _open_snapshot = snap
+    return snap.meetings
+
+
+def is_closed(entry, now=None):
+    """Closed if the code is inactive, the event is over, or a meeting from
+    another day is read outside the 18h-23h30 window."""
+    now = now or datetime.utcnow()
+    today = now.date()
+    meeting = entry.meeting
+    if not entry.active or meeting.event.data_final < today:
+        return True
+    if meeting.data != today:
+        h = now.hour
+        m = now.minute
+        if not ((h >= 18 and h < 23) or (h == 23 and m <= 30)):
+            return True
+    return False
+
+
+def insert_ignore(table, dialect=None):
+    """INSERT that silently skips rows hitting a unique key, for the given
+    dialect name (defaults to the session's)."""
+    dialect = dialect or db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    # MySQL / MariaDB
+    return table.insert().prefix_with('IGNORE')
+
+
+def record_attendance(meeting_id, user_id, confirmado_em=None):
+    """Confirm a participant in a meeting with a single statement.
+
+    Returns the new attendance id, or None when the participant was already
+    registered.  The caller commits.
+    """
+    values = {'meeting_id': meeting_id, 'user_id': user_id}
+    if confirmado_em is not None:
+        values['confirmado_em'] = confirmado_em
+    result = db.session.execute(insert_ignore(Attendance.__table__).values(**values))
+    if result.rowcount != 1:
+        return None
+    att_id = result.inserted_primary_key[0]
+    stats.count_attendance(meeting_id, user_id, att_id)
+    return att_id
+
+
+# keeps IN (...) lists under SQLite's bound-parameter limit
+IN_CHUNK = 500
+
+
+def _chunks(seq, size=IN_CHUNK):
+    seq = list(seq)
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _parse_scanned_at(value):
+    """ISO timestamp from a scanner device -> naive São Paulo time, as stored by scan."""
+    from zoneinfo import ZoneInfo
+    tz = ZoneInfo('America/Sao_Paulo')
+    if not value:
+        return datetime.now(tz).replace(tzinfo=None)
+    ts = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(tz).replace(tzinfo=None)
+    return ts
+
+
+def record_batch(records):
+    """Confirm many (token, telefone, scanned_at) records with set-based queries.
+
+    Returns one status per record, in order ('ok', 'already registered',
+    'invalid qrcode', 'user not found' or 'invalid record'), and the rows
+    that were inserted (with their attendance id).  The caller commits.
+    """
+    statuses = [None] * len(records)
+    parsed = []
+    for idx, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            statuses[idx] = 'invalid record'
+            continue
+        token = rec.get('token')
+        telefone = rec.get('telefone')
+        # JSON from a device may hold anything; lists or objects would break
+        # the set-based lookups below for the whole batch
+        if (not isinstance(token, str) or isinstance(telefone, bool)
+                or not isinstance(telefone, (str, int))):
+            statuses[idx] = 'invalid record'
+            continue
+        telefone = phone_digits(str(telefone))
+        try:
+            scanned_at = _parse_scanned_at(rec.get('scanned_at'))
+        except (TypeError, ValueError):
+            scanned_at = None
+        if not token or not telefone or scanned_at is None:
+            statuses[idx] = 'invalid record'
+            continue
+        parsed.append((idx, token, telefone, scanned_at))
+
+    meetings = {}
+    for chunk in _chunks({p[1] for p in parsed}):
+        meetings.update(db.session.query(QRCode.token, QRCode.meeting_id)
+                        .filter(QRCode.token.in_(chunk), QRCode.active.is_(True)).all())
+    users = {}
+    for chunk in _chunks({p[2] for p in parsed}):
+        users.update(db.session.query(User.telefone_digits, User.id)
+                     .filter(User.telefone_digits.in_(chunk)).all())
+    existing = set()
+    meeting_ids = set(meetings.values())
+    for chunk in _chunks(set(users.values())):
+        if not meeting_ids:
+            break
+        existing.update(db.session.query(Attendance.meeting_id, Attendance.user_id)
+                        .filter(Attendance.meeting_id.in_(meeting_ids),
+                                Attendance.user_id.in_(chunk)).all())
+
+    rows = []
+    positions = []
+    for idx, token, telefone, scanned_at in parsed:
+        meeting_id = meetings.get(token)
+        user_id = users.get(telefone)
+        if meeting_id is None:
+            statuses[idx] = 'invalid qrcode'
+        elif user_id is None:
+            statuses[idx] = 'user not found'
+        elif (meeting_id, user_id) in existing:
+            statuses[idx] = 'already registered'
+        else:
+            # later duplicates inside the same batch count as already registered
+            existing.add((meeting_id, user_id))
+            rows.append({'meeting_id': meeting_id, 'user_id': user_id, 'confirmado_em': scanned_at})
+            positions.append(idx)
+    if not rows:
+        return statuses, rows
+    result = db.session.execute(insert_ignore(Attendance.__table__), rows)
+    all_inserted = (result.rowcount == len(rows)
+                    and db.session.get_bind().dialect.supports_sane_multi_rowcount)
+    stored = {}
+    for chunk in _chunks(rows):
+        stored.update(((m, u), (att_id, confirmado_em)) for att_id, m, u, confirmado_em in
+                      db.session.query(Attendance.id, Attendance.meeting_id, Attendance.user_id,
+                                       Attendance.confirmado_em)
+                      .filter(Attendance.meeting_id.in_({r['meeting_id'] for r in chunk}),
+                              Attendance.user_id.in_({r['user_id'] for r in chunk})))
+    inserted = []
+    for idx, row in zip(positions, rows):
+        att_id, confirmado_em = stored.get((row['meeting_id'], row['user_id']), (None, None))
+        # the insert skips pairs another request stored since the check
+        # above; those keep that request's time (compared to the second:
+        # MySQL DATETIME drops the fraction)
+        ours = att_id is not None and (all_inserted or (
+            confirmado_em is not None
+            and abs(confirmado_em - row['confirmado_em']) < timedelta(seconds=1)))
+        if ours:
+            inserted.append(dict(row, id=att_id))
+            statuses[idx] = 'ok'
+        else:
+            statuses[idx] = 'already registered'
+    if inserted:
+        stats.recount({r['meeting_id'] for r in inserted})
+    return statuses, inserted
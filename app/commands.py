@@ -0,0 +1,141 @@
+"""`flask` CLI commands."""
+import json
+import os
+import tempfile
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+
+@click.command('loadtest')
+@click.option('--phones', default=300, show_default=True, help='Simulated phones arriving.')
+@click.option('--concurrency', default=20, show_default=True, help='Phones checking in at the same time.')
+@click.option('--known-ratio', default=0.7, show_default=True,
+              help='Share of phones already registered (the rest go through /register).')
+@click.option('--database', help='SQLAlchemy URL for the in-process run '
+                                 '(default: scratch SQLite file; tables are created).')
+@click.option('--url', help='Drive a running server over HTTP instead; synthetic data is '
+                            'seeded into the configured database.')
+@click.option('--no-throttle', is_flag=True, help='Disable admission control for the in-process run.')
+@click.option('--keep', is_flag=True, help='Keep the synthetic event/users afterwards.')
+@click.option('--seed', 'seed_value', type=int, help='Random seed for the arrival order.')
+@click.option('--label', default='', help='Free text stored in the results (e.g. version).')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write results as JSON to this file.')
+def loadtest_command(phones, concurrency, known_ratio, database, url, no_throttle, keep,
+                     seed_value, label, output):
+    """Simulate a meeting-night arrival burst through the check-in flow."""
+    from app import create_app, loadtest
+    from config import Config
+
+    if url:
+        target = current_app._get_current_object()
+        transport = loadtest.HttpTransport(url)
+        where = url
+    else:
+        uri = database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='f2f-loadtest-'), 'loadtest.db')
+        if not database:
+            _create_tables(uri)
+
+        class LoadTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = uri
+            THROTTLE_ENABLED = not no_throttle
+            ATTENDANCE_JOURNAL = current_app.config.get('ATTENDANCE_JOURNAL')
+            ASYNC_CHECKIN = current_app.config.get('ASYNC_CHECKIN')
+        target = create_app(LoadTestConfig)
+        transport = loadtest.TestClientTransport(target)
+        where = uri
+
+    with target.app_context():
+        seeded = loadtest.seed(int(round(phones * known_ratio)))
+    click.echo(f'running {phones} phones x {concurrency} concurrent against {where} ...')
+    try:
+        results = loadtest.run(transport, seeded, phones, concurrency, known_ratio, seed_value)
+    finally:
+        if not keep:
+            with target.app_context():
+                loadtest.cleanup(seeded)
+    results['label'] = label
+    results['target'] = where
+
+    click.echo(f"{results['completed_checkins']}/{phones} check-ins in {results['duration_s']}s: "
+               f"{results['checkins_per_s']} check-ins/s, {results['throughput_rps']} req/s, "
+               f"{results['error_count']} errors")
+    for step, lat in results['latency_ms'].items():
+        if lat['count']:
+            click.echo(f"  {step:<14} n={lat['count']:<6} p50={lat['p50']}ms p95={lat['p95']}ms "
+                       f"p99={lat['p99']}ms max={lat['max']}ms")
+    for kind, count in sorted(results['errors'].items()):
+        click.echo(f'  error {kind}: {count}')
+    if output:
+        with open(output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        click.echo(f'results written to {output}')
+
+
+stats_cli = AppGroup('stats', help='Attendance statistics rollup (meeting_stats).')
+
+
+@stats_cli.command('rebuild')
+@click.option('--check', is_flag=True, help='Only compare the rollup with the attendance table.')
+def stats_rebuild_command(check):
+    """Recompute meeting_stats from the attendance table and verify it."""
+    from app import db, stats
+
+    drift = stats.verify()
+    click.echo(f'{len(drift)} rollup rows out of date')
+    for meeting_id, cor, stored, actual in drift[:20]:
+        click.echo(f'  meeting {meeting_id} cor {cor!r}: stored {stored}, actual {actual}')
+    if check:
+        if drift:
+            raise SystemExit(1)
+        return
+    stats.recount()
+    db.session.commit()
+    drift = stats.verify()
+    if drift:
+        raise click.ClickException(f'{len(drift)} rows still differ after rebuild')
+    click.echo('meeting_stats rebuilt and verified')
+
+
+@click.command('snapshot')
+@click.argument('event_id', type=int)
+@click.option('--format', 'fmt', type=click.Choice(['parquet', 'sqlite']),
+              help='Parquet needs pyarrow; defaults to parquet when it is installed.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Output file (default: event-<id>.<format> here).')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows read and written per batch.')
+def snapshot_command(event_id, fmt, output, batch_size):
+    """Write a denormalised attendance snapshot of one event."""
+    import time
+    from app import db, snapshot
+    from app.models import Event
+
+    if db.session.get(Event, event_id) is None:
+        raise click.ClickException(f'event {event_id} not found')
+    fmt = fmt or snapshot.default_format()
+    if fmt not in snapshot.available_formats():
+        raise click.ClickException('parquet snapshots need the pyarrow package; use --format sqlite')
+    output = output or f'event-{event_id}.{fmt}'
+    start = time.perf_counter()
+    count = snapshot.write(event_id, output, fmt, batch_size)
+    click.echo(f'{count} attendance rows written to {output} '
+               f'({os.path.getsize(output) / 1024:.0f} KiB, {time.perf_counter() - start:.1f}s)')
+
+
+def _create_tables(uri):
+    # create_app seeds the default admin, so the schema has to exist first
+    from flask import Flask
+    from app import db
+    scratch = Flask(__name__)
+    scratch.config['SQLALCHEMY_DATABASE_URI'] = uri
+    db.init_app(scratch)
+    with scratch.app_context():
+        from app import models  # noqa: F401
+        db.create_all()
+
+
+def init_app(app):
+    app.cli.add_command(loadtest_command)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(snapshot_command)
@@ -0,0 +1,488 @@
+"""Attendance exports: spreadsheets and PDF reports.
+
+Spreadsheets are written with openpyxl's write-only mode: rows go into
+the sheet as they come off the database cursor (yield_per) and openpyxl
+spools each sheet to a temporary file, so memory stays flat whatever the
+number of participants.  Status cells get their PRESENTE/FALTOU fill as they are
+written.
+
+Event exports read presence from an AttendanceMatrix: one query for the
+(user_id, meeting_id) pairs, pivoted into a participants x meetings
+boolean array that also gives the per-meeting totals.
+
+PDF reports are laid out as one reportlab Table per page (fixed row
+height, header repeated on each) instead of one table that platypus has
+to split over and over, and status colours are applied per run of
+equal cells rather than per cell.  The decoded logo is kept between
+exports.
+
+The files are built and cached by app.jobs.  Queries and rendering are
+kept apart (meeting_pdf = meeting_rows + list_pdf, and so on) so that
+app.bundle can render from plain rows in worker processes.
+
+Raw rows (CSV, NDJSON or a JSON array) are not files: stream_response
+encodes them chunk by chunk as they come off a yield_per cursor, gzipped
+on the fly when the client accepts it, so data starts flowing at once.
+"""
+import csv
+import io
+import json
+import os
+import unicodedata
+import zlib
+from collections import namedtuple
+from datetime import date
+from itertools import chain
+from urllib.parse import quote
+
+from flask import Response, current_app, request, stream_with_context
+
+from app import db
+from app.models import Attendance, Meeting, Region, User
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# rows fetched per round trip while streaming
+FETCH_SIZE = 1000
+
+STREAM_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson',
+                    'json': 'application/json'}
+# rows encoded per chunk of a streamed response
+STREAM_CHUNK = 500
+# height of every PDF table row, in points; sizes the per-page tables
+PDF_ROW_HEIGHT = 18
+
+AttendanceMatrix = namedtuple('AttendanceMatrix', 'meetings user_ids present')
+
+_logos = {}
+
+
+def _styles():
+    from openpyxl.styles import Font, PatternFill
+    return {
+        'header': Font(bold=True),
+        'PRESENTE': PatternFill(start_color='00C6EFCE', fill_type='solid'),
+        'FALTOU': PatternFill(start_color='00FFC7CE', fill_type='solid'),
+    }
+
+
+def _sheet(title):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    return wb, wb.create_sheet(title)
+
+
+def _header(ws, names, styles):
+    from openpyxl.cell import WriteOnlyCell
+    cells = []
+    for name in names:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = styles['header']
+        cells.append(cell)
+    ws.append(cells)
+
+
+ATTENDANCE_COLUMNS = ['id', 'meeting_id', 'event_id', 'meeting_data', 'meeting_titulo',
+                      'user_id', 'nome', 'telefone', 'cor', 'regiao', 'confirmado_em']
+
+
+def attendance_listing(meeting_id=None, event_id=None, after_id=None):
+    """Attendance rows (ATTENDANCE_COLUMNS) in id order, fetched lazily."""
+    q = (db.session.query(Attendance.id, Attendance.meeting_id, Meeting.event_id, Meeting.data,
+                          Meeting.titulo, User.id, User.nome, User.telefone, User.cor,
+                          Region.nome, Attendance.confirmado_em)
+         .join(Meeting, Attendance.meeting_id == Meeting.id)
+         .join(User, Attendance.user_id == User.id)
+         .outerjoin(Region, User.region_id == Region.id))
+    if meeting_id is not None:
+        q = q.filter(Attendance.meeting_id == meeting_id)
+    if event_id is not None:
+        q = q.filter(Meeting.event_id == event_id)
+    if after_id is not None:
+        q = q.filter(Attendance.id > after_id)
+    return q.order_by(Attendance.id).yield_per(FETCH_SIZE)
+
+
+def meeting_rows(meeting_id):
+    """(código, nome, telefone, região, confirmado em) for a meeting, by name."""
+    rows = (db.session.query(User.nome, User.telefone, User.cor, Attendance.confirmado_em)
+            .join(User, Attendance.user_id == User.id)
+            .filter(Attendance.meeting_id == meeting_id)
+            .order_by(User.nome, Attendance.id)
+            .yield_per(FETCH_SIZE))
+    for idx, (nome, telefone, cor, confirmado_em) in enumerate(rows, start=1):
+        yield (idx, nome, telefone, cor,
+               confirmado_em.strftime('%d/%m/%Y %H:%M') if confirmado_em else '')
+
+
+MEETING_COLUMNS = ['Código', 'Nome', 'Telefone', 'Região', 'Confirmado em']
+
+
+def list_workbook(rows):
+    """Attendance list sheet from meeting_rows()."""
+    wb, ws = _sheet('Sheet1')
+    _header(ws, MEETING_COLUMNS, _styles())
+    for row in rows:
+        ws.append(row)
+    return wb
+
+
+def meeting_workbook(meeting):
+    return list_workbook(meeting_rows(meeting.id))
+
+
+def event_columns(meetings):
+    """One status column per meeting, labelled by date (and title when two
+    meetings share a date)."""
+    dates = [m.data.strftime('%d/%m/%Y') for m in meetings]
+    return [f'{d} {m.titulo}'.strip() if dates.count(d) > 1 else d
+            for d, m in zip(dates, meetings)]
+
+
+def attendance_matrix(meetings):
+    """Who attended which of the meetings, as one boolean matrix.
+
+    The (user_id, meeting_id) pairs come from a single query; row i of
+    `present` is the participant `user_ids[i]` (ascending ids), column j
+    is `meetings[j]`.
+    """
+    import numpy as np
+    ids = np.array([m.id for m in meetings], dtype='int64')
+    pairs = np.empty((0, 2), dtype='int64')
+    if len(ids):
+        rows = (db.session.query(Attendance.user_id, Attendance.meeting_id)
+                .filter(Attendance.meeting_id.in_(ids.tolist()))
+                .yield_per(FETCH_SIZE))
+        pairs = np.fromiter(chain.from_iterable(rows), dtype='int64').reshape(-1, 2)
+    user_ids, user_rows = np.unique(pairs[:, 0], return_inverse=True)
+    order = np.argsort(ids)
+    columns = order[np.searchsorted(ids, pairs[:, 1], sorter=order)]
+    present = np.zeros((len(user_ids), len(ids)), dtype=bool)
+    present[user_rows.reshape(-1), columns] = True
+    return AttendanceMatrix(list(meetings), user_ids, present)
+
+
+def matrix_rows(matrix):
+    """The matrix participants by name, as
+    (código, nome, telefone, região, row of attended flags)."""
+    import numpy as np
+    if not len(matrix.user_ids):
+        return
+    participants = (db.session.query(Attendance.user_id)
+                    .filter(Attendance.meeting_id.in_([m.id for m in matrix.meetings]))
+                    .distinct())
+    rows = (db.session.query(User.id, User.nome, User.telefone, User.cor)
+            .filter(User.id.in_(participants))
+            .order_by(User.nome, User.id)
+            .yield_per(FETCH_SIZE))
+    for idx, (uid, nome, telefone, cor) in enumerate(rows, start=1):
+        yield idx, nome, telefone, cor, matrix.present[np.searchsorted(matrix.user_ids, uid)]
+
+
+def matrix_totals(matrix):
+    """'P presentes / F faltas' per meeting column."""
+    present = matrix.present.sum(axis=0)
+    return [f'P {p} / F {len(matrix.user_ids) - p}' for p in present.tolist()]
+
+
+def status(attended):
+    return 'PRESENTE' if attended else 'FALTOU'
+
+
+def event_table(meetings):
+    """Header and rows of the event matrix: PRESENTE/FALTOU per meeting
+    column, then a totals row.  The rows are a generator."""
+    matrix = attendance_matrix(meetings)
+    header = ['Código', 'Nome', 'Telefone', 'Região'] + event_columns(meetings)
+
+    def rows():
+        for idx, nome, telefone, cor, flags in matrix_rows(matrix):
+            yield [idx, nome, telefone, cor] + [status(a) for a in flags.tolist()]
+        if len(matrix.user_ids):
+            yield ['', '', '', 'Totais:'] + matrix_totals(matrix)
+    return header, rows()
+
+
+def matrix_workbook(header, rows):
+    """'Resumo' sheet from event_table(), status cells filled."""
+    from openpyxl.cell import WriteOnlyCell
+    styles = _styles()
+    wb, ws = _sheet('Resumo')
+    _header(ws, header, styles)
+    for row in rows:
+        cells = row[:4]
+        for value in row[4:]:
+            if value in ('PRESENTE', 'FALTOU'):
+                value = WriteOnlyCell(ws, value=value)
+                value.fill = styles[value.value]
+            cells.append(value)
+        ws.append(cells)
+    return wb
+
+
+def event_workbook(meetings):
+    return matrix_workbook(*event_table(meetings))
+
+
+def dashboard_workbook(stats_rows):
+    """Dashboard statistics, one row per meeting and one column per colour."""
+    colours = list(dict.fromkeys(cor for s in stats_rows for cor in s['by_region']))
+    wb, ws = _sheet('Sheet1')
+    if stats_rows:
+        _header(ws, ['Evento', 'Reunião', 'Total', 'Novos', 'Faltaram']
+                + [f'Região {cor}' for cor in colours], _styles())
+    for s in stats_rows:
+        mt = s['meeting']
+        ws.append([s['event'].nome, mt.titulo or mt.data.strftime('%d/%m/%Y'),
+                   s['total'], s['new'], s['missing']]
+                  + [s['by_region'].get(cor) for cor in colours])
+    return wb
+
+
+def dashboard_pdf(stats_rows):
+    """One line per meeting with its attendance total."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    out = io.BytesIO()
+    c = canvas.Canvas(out, pagesize=letter)
+    text = c.beginText(40, 750)
+    text.textLine("Dashboard statistics")
+    text.textLine('')
+    for s in stats_rows:
+        text.textLine(f"{s['event'].nome} - {s['meeting'].titulo or s['meeting'].data.strftime('%d/%m/%Y')}: {s['total']} presenças")
+    c.drawText(text)
+    c.showPage()
+    c.save()
+    out.seek(0)
+    return out
+
+
+def logo_path():
+    return os.path.join(current_app.root_path, 'static', 'logo.png')
+
+
+def logo(path=None):
+    """The report logo as a reportlab Image, decoded once per process."""
+    from reportlab.platypus import Image
+    path = path or logo_path()
+    if path not in _logos:
+        try:
+            with open(path, 'rb') as f:
+                _logos[path] = Image(io.BytesIO(f.read()), width=100, height=100)
+        except Exception:
+            _logos[path] = None
+    return _logos[path]
+
+
+def _footer(canvas, doc):
+    from reportlab.lib.pagesizes import letter
+    width, height = letter
+    canvas.setFont("Helvetica", 8)
+    canvas.drawString(40, 20, "Primeira Igreja Batista de Marília")
+    canvas.drawCentredString(width/2, 20, "Face a Face de Homens")
+    canvas.drawRightString(width-40, 20, str(doc.page))
+
+
+def _height(flowables, doc):
+    # upper bound for the space the flowables take in the frame
+    total = 0
+    for f in flowables:
+        _, h = f.wrap(doc.width, doc.height)
+        total += h + f.getSpaceBefore() + f.getSpaceAfter()
+    return total
+
+
+def page_tables(doc, header, rows, style, used=0):
+    """Flowables laying `rows` out as one table per page, each starting
+    with `header`.  `used` is the height already taken on the first page;
+    style(chunk) returns the TableStyle commands for a chunk of rows
+    (row 0 of the chunk is table row 1)."""
+    from reportlab.platypus import PageBreak, Table, TableStyle
+    # Frame keeps 6pt of padding on each side; one row goes to the header
+    per_page = int((doc.height - 12) // PDF_ROW_HEIGHT) - 1
+    size = int((doc.height - 12 - used) // PDF_ROW_HEIGHT) - 1
+    flowables = []
+    if size < 1:
+        flowables.append(PageBreak())
+        size = per_page
+    start = 0
+    while True:
+        chunk = rows[start:start + size]
+        t = Table([header] + chunk, rowHeights=PDF_ROW_HEIGHT, repeatRows=1)
+        t.setStyle(TableStyle(style(chunk)))
+        flowables.append(t)
+        start += size
+        if start >= len(rows):
+            return flowables
+        flowables.append(PageBreak())
+        size = per_page
+
+
+def runs(values):
+    """(start, end, value) for each run of equal consecutive values."""
+    start = 0
+    for i in range(1, len(values) + 1):
+        if i == len(values) or values[i] != values[start]:
+            yield start, i - 1, values[start]
+            start = i
+
+
+def _document(out):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+    return SimpleDocTemplate(out, pagesize=letter)
+
+
+def list_pdf(titulo, data, rows, logo_file=None):
+    """Attendance list PDF of a meeting from meeting_rows(), with totals."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer
+    out = io.BytesIO()
+    doc = _document(out)
+    styles = getSampleStyleSheet()
+    elements = []
+    image = logo(logo_file)
+    if image is not None:
+        elements += [image, Spacer(1, 6)]
+    # heading structure: main title, then meeting title and date
+    elements += [Paragraph("Lista de presença", styles['Heading1']), Spacer(1, 6),
+                 Paragraph(titulo or '', styles['Heading3']),
+                 Paragraph(data.strftime('%d/%m/%Y'), styles['Heading4']),
+                 Spacer(1, 12)]
+    rows = [list(row) for row in rows]
+    count = len(rows)
+    # totals row inside table
+    rows.append(['', '', '', 'Total presentes', count])
+
+    def style(chunk):
+        cmds = [('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey)]
+        if chunk[-1] is rows[-1]:
+            cmds.append(('SPAN', (-2, -1), (-1, -1)))
+        return cmds
+
+    elements += page_tables(doc, MEETING_COLUMNS, rows, style, _height(elements, doc))
+    elements += [Spacer(1, 12),
+                 Paragraph(f"Total de presentes: {count}", styles['Normal'])]
+    doc.build(elements, onFirstPage=_footer, onLaterPages=_footer)
+    out.seek(0)
+    return out
+
+
+def meeting_pdf(meeting):
+    """Attendance list of a meeting, sorted by name, with totals."""
+    return list_pdf(meeting.titulo, meeting.data, meeting_rows(meeting.id))
+
+
+def matrix_pdf(nome, header, rows, logo_file=None):
+    """Event matrix PDF from event_table()."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer
+    out = io.BytesIO()
+    doc = _document(out)
+    styles = getSampleStyleSheet()
+    elements = []
+    image = logo(logo_file)
+    if image is not None:
+        elements += [image, Spacer(1, 6)]
+    elements += [Paragraph('Lista de presença', styles['Heading1']), Spacer(1, 6),
+                 Paragraph(nome.upper(), styles['Heading3']), Spacer(1, 12)]
+    rows = list(rows)
+    fills = {'PRESENTE': colors.lightgreen, 'FALTOU': colors.salmon}
+
+    def style(chunk):
+        cmds = [('GRID', (0, 0), (-1, -1), 0.5, colors.black)]
+        for c in range(4, len(header)):
+            for start, end, value in runs([r[c] for r in chunk]):
+                if value in fills:
+                    cmds.append(('BACKGROUND', (c, start + 1), (c, end + 1), fills[value]))
+        return cmds
+
+    elements += page_tables(doc, header, rows, style, _height(elements, doc))
+    doc.build(elements, onFirstPage=_footer, onLaterPages=_footer)
+    out.seek(0)
+    return out
+
+
+def event_pdf(event, meetings):
+    """PRESENTE/FALTOU matrix of an event's participants over its meetings."""
+    header, rows = event_table(meetings)
+    return matrix_pdf(event.nome, header, rows)
+
+
+def save(result, path):
+    """Write a workbook, a BytesIO report or anything with save(path) to `path`."""
+    if hasattr(result, 'save'):
+        result.save(path)
+    else:
+        with open(path, 'wb') as f:
+            f.write(result.getvalue())
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def encode_rows(columns, rows, fmt):
+    """Text chunks of `rows` as csv (with a header), ndjson or a json array."""
+    if fmt == 'csv':
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        for i, row in enumerate(rows, start=1):
+            writer.writerow([_plain(v) for v in row])
+            if i % STREAM_CHUNK == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+        return
+    if fmt == 'json':
+        yield '['
+    out = []
+    for i, row in enumerate(rows):
+        item = json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False)
+        if fmt == 'ndjson':
+            out.append(item + '\n')
+        else:
+            out.append(',' + item if i else item)
+        if len(out) == STREAM_CHUNK:
+            yield ''.join(out)
+            out = []
+    yield ''.join(out)
+    if fmt == 'json':
+        yield ']'
+
+
+def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def _attachment(name):
+    # same encoding as flask.send_file for non-ASCII names
+    try:
+        name.encode('ascii')
+        return f'attachment; filename="{name}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        return f'attachment; filename="{simple}"; filename*=UTF-8\'\'{quote(name, safe="!#$&+^`|~")}'
+
+
+def stream_response(columns, rows, fmt, download_name=None):
+    """Streamed response for `rows`; pass ?gzip=0 to turn compression off."""
+    chunks = (c.encode('utf-8') for c in encode_rows(columns, rows, fmt))
+    headers = {'Vary': 'Accept-Encoding'}
+    if request.args.get('gzip') != '0' and request.accept_encodings['gzip'] > 0:
+        chunks = _gzip(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    if download_name:
+        headers['Content-Disposition'] = _attachment(f'{download_name}.{fmt}')
+    return Response(stream_with_context(chunks), headers=headers,
+                    content_type=f'{STREAM_MIMETYPES[fmt]}; charset=utf-8')
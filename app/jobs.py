@@ -0,0 +1,230 @@
+"""Background export jobs with an on-disk artifact cache.
+
+Exports (dashboard, meeting list and event matrix as xlsx or pdf; event
+snapshots as parquet or sqlite; the zip bundle of all of an event's
+reports) are built by a bounded thread pool
+instead of the request thread.  Finished files are stored in EXPORT_DIR
+under a name made of (kind, id, format, data version), so asking again for unchanged data is answered from disk at
+once; any committed write bumps the version (see app.cache) and the next
+request builds a new file.  Artifacts are evicted by age (EXPORT_MAX_AGE)
+and then by total size (EXPORT_MAX_BYTES), least recently used first.
+
+Job status is kept per process.
+"""
+import os
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flask import current_app
+
+from app import db, bundle, cache, exports, snapshot, stats
+from app.models import Event, Meeting
+
+
+MIMETYPES = {'xlsx': exports.XLSX_MIMETYPE, 'pdf': 'application/pdf',
+             'parquet': 'application/vnd.apache.parquet', 'sqlite': 'application/vnd.sqlite3',
+             'zip': 'application/zip'}
+
+
+def _dashboard(_, fmt):
+    rows = stats.meeting_stats()
+    return exports.dashboard_workbook(rows) if fmt == 'xlsx' else exports.dashboard_pdf(rows)
+
+
+def _meeting(meeting_id, fmt):
+    mt = db.session.get(Meeting, meeting_id)
+    return exports.meeting_workbook(mt) if fmt == 'xlsx' else exports.meeting_pdf(mt)
+
+
+def _event(event_id, fmt):
+    ev = db.session.get(Event, event_id)
+    meetings = sorted(ev.meetings, key=lambda m: m.data)
+    return exports.event_workbook(meetings) if fmt == 'xlsx' else exports.event_pdf(ev, meetings)
+
+
+def _snapshot(event_id, fmt):
+    return snapshot.Snapshot(event_id, fmt)
+
+
+def _bundle(event_id, _):
+    return bundle.Bundle(event_id, get().directory)
+
+
+BUILDERS = {'dashboard': _dashboard, 'meeting': _meeting, 'event': _event, 'snapshot': _snapshot,
+            'bundle': _bundle}
+# formats each kind of export comes in
+FORMATS = {'dashboard': ('xlsx', 'pdf'), 'meeting': ('xlsx', 'pdf'), 'event': ('xlsx', 'pdf'),
+           'snapshot': snapshot.FORMATS, 'bundle': ('zip',)}
+
+
+class ExportJob:
+
+    def __init__(self, key, path, download_name):
+        self.id = secrets.token_urlsafe(12)
+        self.key = key
+        self.path = path
+        self.download_name = download_name
+        self.status = 'pending'
+        self.error = None
+        self.created = time.time()
+        self.future = None
+        # (done, total) for builds that report it
+        self.progress = None
+
+    @property
+    def kind(self):
+        return self.key[0]
+
+    @property
+    def format(self):
+        return self.key[2]
+
+    @property
+    def mimetype(self):
+        return MIMETYPES[self.format]
+
+    def report(self, done, total):
+        self.progress = (done, total)
+
+    def as_json(self):
+        return {'id': self.id, 'kind': self.kind, 'object_id': self.key[1],
+                'format': self.format, 'status': self.status, 'error': self.error,
+                'progress': self.progress, 'download_name': self.download_name}
+
+
+class ExportQueue:
+
+    def __init__(self, app, directory, workers=2, max_age=86400, max_bytes=200 * 1024 * 1024):
+        self.app = app
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        # no workers: build in the calling thread (still cached)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='export') if workers > 0 else None
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind, object_id, fmt):
+        versions = cache.get(self.app).versions
+        return (kind, object_id or 0, fmt, versions.scope, versions.get())
+
+    def _path(self, key):
+        kind, object_id, fmt, scope, version = key
+        return os.path.join(self.directory, f'{kind}-{object_id}-{scope}-{version}.{fmt}')
+
+    def submit(self, kind, object_id, fmt, download_name):
+        """Job for the export at the current data version: an artifact
+        already on disk, the job building it, or a newly queued one."""
+        key = self.key(kind, object_id, fmt)
+        path = self._path(key)
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.status in ('pending', 'running'):
+                return job
+            if os.path.exists(path):
+                # mark as recently used for the size-based eviction
+                os.utime(path)
+                if job is None or job.status != 'done':
+                    job = self._add(ExportJob(key, path, f'{download_name}.{fmt}'))
+                    job.status = 'done'
+                return job
+            job = self._add(ExportJob(key, path, f'{download_name}.{fmt}'))
+        if self._pool is None:
+            self._run(job)
+        else:
+            job.future = self._pool.submit(self._run, job)
+        return job
+
+    def _add(self, job):
+        self._jobs[job.id] = job
+        self._by_key[job.key] = job
+        return job
+
+    def wait(self, job, timeout):
+        """True once the job's file is ready, waiting up to `timeout` seconds."""
+        if job.future is not None and job.status in ('pending', 'running'):
+            wait([job.future], timeout=timeout)
+        return job.status == 'done'
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        tmp = f'{job.path}.{secrets.token_hex(4)}.tmp'
+        try:
+            with self.app.app_context():
+                result = BUILDERS[job.kind](job.key[1], job.format)
+                if isinstance(result, bundle.Bundle):
+                    result.save(tmp, progress=job.report)
+                else:
+                    exports.save(result, tmp)
+            os.replace(tmp, job.path)
+            job.status = 'done'
+        except Exception as exc:
+            self.app.logger.exception('export %s failed', job.key)
+            job.status = 'error'
+            job.error = str(exc)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def evict(self):
+        """Drop artifacts older than max_age, then the least recently used
+        ones until the total fits max_bytes; forget old finished jobs."""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            # half-written files belong to a running job unless abandoned
+            if entry.name.endswith('.tmp') and now - st.st_mtime < self.max_age:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for i, (mtime, size, path) in enumerate(files):
+            # the most recently used file stays even if it alone is too big
+            over = total > self.max_bytes and i < len(files) - 1
+            if now - mtime <= self.max_age and not over:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.status in ('done', 'error') and now - job.created > self.max_age:
+                    del self._jobs[job_id]
+                    if self._by_key.get(job.key) is job:
+                        del self._by_key[job.key]
+
+    def info(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        files = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith('.tmp')]
+        return {'jobs': {status: sum(1 for j in jobs if j.status == status)
+                         for status in ('pending', 'running', 'done', 'error')},
+                'files': len(files), 'bytes': sum(e.stat().st_size for e in files),
+                'max_bytes': self.max_bytes, 'max_age': self.max_age}
+
+
+def get(app=None):
+    app = app or current_app
+    return app.extensions.get('exports')
+
+
+def init_app(app):
+    directory = app.config.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'f2f-exports')
+    app.extensions['exports'] = ExportQueue(app, directory,
+                                            workers=app.config.get('EXPORT_WORKERS', 2),
+                                            max_age=app.config.get('EXPORT_MAX_AGE', 86400),
+                                            max_bytes=app.config.get('EXPORT_MAX_BYTES', 200 * 1024 * 1024))
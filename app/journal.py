@@ -0,0 +1,189 @@
+"""Write-behind journal for check-ins (opt-in via ATTENDANCE_JOURNAL).
+
+A scan is acknowledged as soon as it is appended to a local SQLite file
+opened with synchronous=FULL, so it survives a crash.  A background thread
+moves pending rows into the attendance table in batches and the journal is
+replayed on startup; the unique (meeting, user) index makes replays safe.
+"""
+import atexit
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from app import db
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    meeting_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    confirmado_em TEXT NOT NULL,
+    UNIQUE (meeting_id, user_id)
+)
+'''
+
+
+def stored_query(meeting_id, user_id):
+    """The attendance row of the pair, for record() and record_async()."""
+    from app.models import Attendance
+    return db.select(Attendance.id).filter_by(meeting_id=meeting_id, user_id=user_id).limit(1)
+
+
+def _local_time(value):
+    # scans queue aware São Paulo times; the attendance table stores them
+    # naive, as checkin.record_batch does
+    from zoneinfo import ZoneInfo
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(ZoneInfo('America/Sao_Paulo')).replace(tzinfo=None)
+    return ts
+
+
+class AttendanceJournal:
+
+    def __init__(self, app, path, batch_size=200, interval_ms=500):
+        self.app = app
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, meeting_id, user_id, confirmado_em):
+        """Durably queue a check-in; False if it is already queued."""
+        cur = self._conn().execute(
+            'INSERT OR IGNORE INTO pending (meeting_id, user_id, confirmado_em) VALUES (?, ?, ?)',
+            (meeting_id, user_id, confirmado_em.isoformat()))
+        if cur.rowcount == 1 and self.pending() >= self.batch_size:
+            self._wake.set()
+        return cur.rowcount == 1
+
+    def record(self, meeting_id, user_id, confirmado_em):
+        """Same contract as checkin.record_attendance, but nothing is written
+        to the main database in the request."""
+        stored = db.session.execute(stored_query(meeting_id, user_id)).first()
+        return self._record(stored, meeting_id, user_id, confirmado_em)
+
+    async def record_async(self, s, meeting_id, user_id, confirmado_em):
+        """record() for the async views, checking on their AsyncSession."""
+        stored = (await s.execute(stored_query(meeting_id, user_id))).first()
+        return self._record(stored, meeting_id, user_id, confirmado_em)
+
+    def _record(self, stored, meeting_id, user_id, confirmado_em):
+        # already registered: in the database or already queued
+        if stored is not None:
+            return False
+        return self.append(meeting_id, user_id, confirmado_em)
+
+    def pending(self):
+        return self._conn().execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def flush(self):
+        """Move up to one batch into the database; returns the number of rows moved."""
+        from app import stats
+        from app.checkin import insert_ignore
+        from app.models import Attendance
+        conn = self._conn()
+        rows = conn.execute('SELECT id, meeting_id, user_id, confirmado_em FROM pending '
+                            'ORDER BY id LIMIT ?', (self.batch_size,)).fetchall()
+        if not rows:
+            return 0
+        with self.app.app_context():
+            db.session.execute(insert_ignore(Attendance.__table__), [
+                {'meeting_id': mid, 'user_id': uid, 'confirmado_em': _local_time(ts)}
+                for _, mid, uid, ts in rows])
+            stats.recount({mid for _, mid, _, _ in rows})
+            db.session.commit()
+        # only forget rows once the database has them; a crash in between
+        # just replays rows the unique index will ignore
+        conn.executemany('DELETE FROM pending WHERE id = ?', [(r[0],) for r in rows])
+        try:
+            with self.app.app_context():
+                self._publish(rows)
+        except Exception:
+            # the rows are stored; a live page just misses them until it reloads
+            self.app.logger.exception('attendance journal live publish failed')
+        return len(rows)
+
+    def _publish(self, rows):
+        # the live attendance tables get the rows now that they have an id;
+        # a pair the database already had keeps its own time and is skipped
+        from app import live
+        from app.models import Attendance, User
+        meeting_ids = {mid for _, mid, _, _ in rows}
+        if not live.listening(meeting_ids):
+            return
+        times = {(mid, uid): _local_time(ts) for _, mid, uid, ts in rows}
+        stored = (db.session.query(Attendance, User).join(User, Attendance.user_id == User.id)
+                  .filter(Attendance.meeting_id.in_(meeting_ids),
+                          Attendance.user_id.in_({uid for _, _, uid, _ in rows})))
+        for att, user in stored:
+            ts = times.get((att.meeting_id, att.user_id))
+            if (ts is not None and att.confirmado_em is not None
+                    and abs(att.confirmado_em - ts) < timedelta(seconds=1)):
+                live.attendance_added(att.meeting_id, user, att.confirmado_em, att.id)
+
+    def drain(self):
+        while self.flush():
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                # keep the rows queued and retry on the next tick
+                self.app.logger.exception('attendance journal flush failed')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='attendance-journal', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.drain()
+        except Exception:
+            self.app.logger.exception('attendance journal flush failed at shutdown')
+
+
+def init_app(app):
+    path = app.config.get('ATTENDANCE_JOURNAL')
+    if not path:
+        return
+    journal = AttendanceJournal(app, path,
+                                batch_size=app.config.get('ATTENDANCE_JOURNAL_BATCH', 200),
+                                interval_ms=app.config.get('ATTENDANCE_JOURNAL_FLUSH_MS', 500))
+    app.extensions['attendance_journal'] = journal
+    # replay anything left behind by a crash before serving requests
+    try:
+        journal.drain()
+    except Exception:
+        app.logger.exception('attendance journal replay failed')
+    journal.start()
+
+
+def get(app=None):
+    from flask import current_app
+    return (app or current_app).extensions.get('attendance_journal')
@@ -0,0 +1,119 @@
+"""In-process pub/sub feeding the live attendance streams (Server-Sent Events).
+
+Check-in paths call attendance_added()/attendance_removed() after their
+commit; every open /admin/meetings/<id>/attendance/stream connection of
+this process receives the change.  Each worker process only sees its own
+writes, so with several workers a page may miss rows until it reloads.
+"""
+import json
+import queue
+import threading
+
+from flask import current_app
+
+
+_subscribers = {}
+_lock = threading.Lock()
+
+# per-connection backlog; a stalled browser is dropped instead of blocking writers
+QUEUE_SIZE = 1000
+
+
+def subscribe(meeting_id):
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(meeting_id, set()).add(q)
+    return q
+
+
+def unsubscribe(meeting_id, q):
+    with _lock:
+        subs = _subscribers.get(meeting_id)
+        if subs is not None:
+            subs.discard(q)
+            if not subs:
+                del _subscribers[meeting_id]
+
+
+def publish(meeting_id, event, data):
+    with _lock:
+        subs = list(_subscribers.get(meeting_id, ()))
+    for q in subs:
+        try:
+            q.put_nowait((event, data))
+        except queue.Full:
+            unsubscribe(meeting_id, q)
+
+
+def listening(meeting_ids):
+    """True if any of the meetings has an open stream in this process."""
+    return any(mid in _subscribers for mid in meeting_ids)
+
+
+def row(att_id, user, confirmado_em):
+    """Event data of an attendance, as the table shows it."""
+    fmt = current_app.jinja_env.filters['datetime']
+    return {
+        'id': att_id,
+        'user_id': user.id,
+        'nome': user.nome,
+        'telefone': user.telefone,
+        'cor': user.cor,
+        'confirmado_em': fmt(confirmado_em, '%d/%m %H:%M'),
+    }
+
+
+def attendance_added(meeting_id, user, confirmado_em, att_id):
+    # rows without an id yet (journalled check-ins) are published once stored
+    if att_id is None or not listening((meeting_id,)):
+        return
+    publish(meeting_id, 'added', row(att_id, user, confirmado_em))
+
+
+def attendance_removed(meeting_id, att_id):
+    publish(meeting_id, 'removed', {'id': att_id})
+
+
+def _event(event, data):
+    # added rows carry their id so a reconnecting EventSource sends it back
+    # as Last-Event-ID
+    head = f"id: {data['id']}\n" if event == 'added' else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream(meeting_id, q, total, backlog=(), hidden=(), keepalive=15):
+    """SSE body: the current total, the `backlog` rows, then one event per
+    change.
+
+    The caller subscribes `q` first and then counts `total` and reads
+    `backlog` (rows added since the page was rendered), so no check-in
+    falls in between; rows both read and published are sent once.  Rows
+    of `hidden` users count in the total but are not sent.  The generator
+    itself never touches the database.
+    """
+    seen = set()
+    try:
+        yield _event('total', {'total': total})
+        for data in backlog:
+            seen.add(data['id'])
+            if data['user_id'] not in hidden:
+                yield _event('added', dict(data, total=total))
+        while True:
+            try:
+                event, data = q.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if event == 'added':
+                if data['id'] in seen:
+                    continue
+                seen.add(data['id'])
+                total += 1
+            else:
+                total -= 1
+            if event == 'added' and data['user_id'] in hidden:
+                yield _event('total', {'total': total})
+            else:
+                yield _event(event, dict(data, total=total))
+    finally:
+        unsubscribe(meeting_id, q)
@@ -0,0 +1,183 @@
+"""Meeting-night arrival burst simulator used by `flask loadtest`.
+
+Every simulated phone walks the real check-in flow:
+
+    GET /scan/<token> -> POST /scan/<token>
+        known phone   -> confirmation page
+        unknown phone -> GET /register/<token> -> POST /register/<token>
+
+Phones run concurrently from a thread pool, either in-process through the
+Flask test client against a scratch database, or over HTTP against a
+running server.  Results (throughput, latency percentiles, errors) are
+returned as a dict ready to be dumped to JSON.
+"""
+import random
+import secrets
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from app import db
+
+
+STEPS = ('scan_get', 'scan_post', 'register_get', 'register_post')
+# synthetic phones use an impossible area code so they never clash with real ones
+PHONE_PREFIX = '00'
+
+
+def seed(n_known):
+    """Create the synthetic event/meeting/QR code and the known participants."""
+    from app.models import Event, Meeting, QRCode, User, Region
+    today = date.today()
+    stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    ev = Event(nome=f'LOADTEST {stamp}', data_inicial=today, data_final=today + timedelta(days=1))
+    mt = Meeting(event=ev, titulo=f'LOADTEST {stamp}', data=today)
+    qr = QRCode(meeting=mt, token='loadtest-' + secrets.token_urlsafe(12), active=True)
+    db.session.add_all([ev, mt, qr])
+    db.session.add_all([User(telefone=f'{PHONE_PREFIX}{stamp[-6:]}{i:05d}', nome=f'LOADTEST {i}', cor='')
+                        for i in range(n_known)])
+    db.session.commit()
+    region = Region.query.order_by(Region.id).first()
+    return {'event_id': ev.id, 'meeting_id': mt.id, 'token': qr.token,
+            'region_id': region.id if region else None, 'phone_base': f'{PHONE_PREFIX}{stamp[-6:]}'}
+
+
+def cleanup(seeded):
+    from app.models import Event, User
+    from app import checkin
+    # the event first: its cascade removes the attendances that reference
+    # the users (MySQL enforces the foreign key, SQLite does not)
+    ev = db.session.get(Event, seeded['event_id'])
+    if ev is not None:
+        db.session.delete(ev)
+        db.session.flush()
+    db.session.query(User).filter(User.telefone.like(seeded['phone_base'] + '%')).delete(synchronize_session=False)
+    db.session.commit()
+    checkin.invalidate()
+
+
+class TestClientTransport:
+    """Drives an app in-process; each phone gets its own client and IP."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self, idx):
+        client = self.app.test_client()
+        environ = {'REMOTE_ADDR': f'10.{idx // 65536 % 256}.{idx // 256 % 256}.{idx % 256}'}
+
+        def request(method, path, data=None):
+            r = client.open(path, method=method, data=data, environ_base=environ)
+            return r.status_code, r.headers.get('Location', '')
+        return request
+
+
+class HttpTransport:
+    """Drives a running server over HTTP with `requests`."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def session(self, idx):
+        import requests
+        s = requests.Session()
+
+        def request(method, path, data=None):
+            r = s.request(method, self.base_url + path, data=data, allow_redirects=False, timeout=30)
+            return r.status_code, r.headers.get('Location', '')
+        return request
+
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))] * 1000, 2)
+    return {'count': len(values), 'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+            'max': round(values[-1] * 1000, 2)}
+
+
+def run(transport, seeded, phones, concurrency, known_ratio, seed_value=None):
+    """Simulate `phones` arrivals; the first round(phones*known_ratio) are known."""
+    rng = random.Random(seed_value)
+    n_known = int(round(phones * known_ratio))
+    order = list(range(phones))
+    rng.shuffle(order)
+    token = seeded['token']
+    latencies = {step: [] for step in STEPS}
+    flows = []
+    errors = {}
+    lock = threading.Lock()
+
+    def fail(kind):
+        with lock:
+            errors[kind] = errors.get(kind, 0) + 1
+
+    def timed(step, call, *args, **kwargs):
+        start = time.perf_counter()
+        status, location = call(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[step].append(elapsed)
+        if status == 429:
+            fail(f'{step}:throttled')
+        elif status >= 400:
+            fail(f'{step}:{status}')
+        return status, location
+
+    def phone(idx):
+        known = idx < n_known
+        # known phones match seeded users; unknown ones use a disjoint range
+        telefone = f"{seeded['phone_base']}{idx if known else 50000 + idx:05d}"
+        request = transport.session(idx)
+        start = time.perf_counter()
+        try:
+            status, _ = timed('scan_get', request, 'GET', f'/scan/{token}')
+            if status != 200:
+                return
+            status, location = timed('scan_post', request, 'POST', f'/scan/{token}', {'telefone': telefone})
+            if known:
+                if status != 200:
+                    fail('known:not_confirmed')
+                    return
+            else:
+                if status != 302 or '/register/' not in location:
+                    fail('unknown:not_redirected')
+                    return
+                path = f'/register/{token}?telefone={telefone}'
+                status, _ = timed('register_get', request, 'GET', path)
+                if status != 200:
+                    return
+                status, _ = timed('register_post', request, 'POST', path,
+                                  {'nome': f'LOADTEST NOVO {idx}', 'region_id': seeded['region_id'] or ''})
+                if status != 200:
+                    return
+            with lock:
+                flows.append(time.perf_counter() - start)
+        except Exception as exc:
+            fail(f'exception:{type(exc).__name__}')
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(phone, order))
+    wall = time.perf_counter() - wall
+
+    n_requests = sum(len(v) for v in latencies.values())
+    return {
+        'phones': phones,
+        'known': n_known,
+        'unknown': phones - n_known,
+        'concurrency': concurrency,
+        'duration_s': round(wall, 3),
+        'requests': n_requests,
+        'throughput_rps': round(n_requests / wall, 1) if wall else None,
+        'checkins_per_s': round(len(flows) / wall, 1) if wall else None,
+        'completed_checkins': len(flows),
+        'errors': errors,
+        'error_count': sum(errors.values()),
+        'latency_ms': dict({step: _percentiles(latencies[step]) for step in STEPS},
+                           checkin=_percentiles(flows)),
+    }
@@ -1,10 +1,8 @@
-from flask import render_template, request, redirect, url_for, flash, abort, current_app, make_response
+from flask import render_template, request, redirect, url_for, flash, abort, current_app
 from app.main import bp
-from app import db
+from app import db, checkin, journal, live, qrimage
 from app.models import User, Attendance, QRCode, Meeting, Region, AccessRequest
 from datetime import datetime
-import qrcode
-import io
 
 
 @bp.route('/')
@@ -13,46 +11,24 @@ def index():
     from flask_login import current_user
     open_meetings = []
     if not current_user.is_authenticated:
-        today = datetime.utcnow().date()
-        now = datetime.utcnow()
-        # gather active qrcodes for meetings that are still open
-        for qr in QRCode.query.filter_by(active=True).all():
-            mt = qr.meeting
-            if mt.event.data_final < today:
-                continue
-            closed = False
-            if mt.data != today:
-                h = now.hour
-                m = now.minute
-                if not ((h >= 18 and h < 23) or (h == 23 and m <= 30)):
-                    closed = True
-            if not closed:
-                open_meetings.append((mt, qr))
+        # precomputed snapshot of active QR codes whose meeting is open now
+        open_meetings = checkin.open_meetings()
     return render_template('index.html', open_meetings=open_meetings)
 
 
 @bp.route('/scan/<token>', methods=['GET', 'POST'])
 def scan(token):
-    # token identifies a QRCode which is tied to a meeting
-    qrcode = QRCode.query.filter_by(token=token).first_or_404()
-    meeting = qrcode.meeting
+    # token identifies a QRCode which is tied to a meeting; resolved from the
+    # in-process cache so a valid scan doesn't hit the database
+    entry = checkin.resolve(token)
+    if entry is None:
+        abort(404)
+    meeting = entry.meeting
     # if this qrcode was deprecated but another active exists, redirect
-    if not qrcode.active:
-        replacement = QRCode.query.filter_by(meeting_id=meeting.id, active=True).first()
-        if replacement:
-            return redirect(url_for('main.scan', token=replacement.token))
+    if not entry.active and entry.replacement:
+        return redirect(url_for('main.scan', token=entry.replacement))
     # compute closed flag (inactive, event over, or outside allowed time)
-    today = datetime.utcnow().date()
-    now = datetime.utcnow()
-    closed = False
-    if not qrcode.active or meeting.event.data_final < today:
-        closed = True
-    elif meeting.data != today:
-        h = now.hour
-        m = now.minute
-        if not ((h >= 18 and h < 23) or (h == 23 and m <= 30)):
-            closed = True
-    if closed:
+    if checkin.is_closed(entry):
         flash('Inscrições encerradas para este QR code', 'danger')
         return render_template('scan.html', token=token, meeting=meeting, datetime=datetime, closed=True, simple=True)
     if request.method == 'POST':
@@ -62,25 +38,26 @@ def scan(token):
         if not telefone:
             flash('Informe o telefone', 'danger')
             return redirect(url_for('main.scan', token=token))
-        # re-check closed on POST as well
-        today = datetime.utcnow().date()
-        now = datetime.utcnow()
-        if not qrcode.active or meeting.event.data_final < today or (meeting.data != today and not ((now.hour >= 18 and now.hour < 23) or (now.hour == 23 and now.minute <= 30))):
-            flash('Inscrições encerradas para este QR code', 'danger')
-            return redirect(url_for('main.scan', token=token))
-        user = User.query.filter_by(telefone=telefone).first()
+        user = User.by_phone(telefone)
         if user:
-            # register attendance if not already done
-            existing = Attendance.query.filter_by(meeting=meeting, user=user).first()
-            if existing:
-                flash('Telefone já registrado nesta reunião', 'info')
+            # register attendance if not already done (one idempotent insert)
+            from zoneinfo import ZoneInfo
+            confirmado_em = datetime.now(ZoneInfo('America/Sao_Paulo'))
+            jr = journal.get()
+            att_id = None
+            if jr is not None:
+                # write-behind mode: acknowledged once it is in the local journal
+                created = jr.record(meeting.id, user.id, confirmado_em)
             else:
-                from zoneinfo import ZoneInfo
-                att = Attendance(meeting=meeting, user=user,
-                                 confirmado_em=datetime.now(ZoneInfo('America/Sao_Paulo')))
-                db.session.add(att)
+                att_id = checkin.record_attendance(meeting.id, user.id, confirmado_em=confirmado_em)
                 db.session.commit()
+                created = att_id is not None
+            if created:
+                # journalled check-ins reach the live tables once flushed
+                live.attendance_added(meeting.id, user, confirmado_em, att_id)
                 flash('Presença confirmada!', 'success')
+            else:
+                flash('Telefone já registrado nesta reunião', 'info')
                 # notifications removed (no external integrations)
             return render_template('confirm.html', user=user, meeting=meeting, simple=True)
         else:
@@ -95,14 +72,14 @@ def register(token):
     telefone = ''.join(ch for ch in telefone if ch.isdigit())
     if not telefone:
         return redirect(url_for('main.scan', token=token))
-    qrcode = QRCode.query.filter_by(token=token).first_or_404()
-    meeting = qrcode.meeting
+    entry = checkin.resolve(token)
+    if entry is None:
+        abort(404)
+    meeting = entry.meeting
     regions = Region.query.order_by(Region.nome).all()
     if request.method == 'POST':
         # prevent register if closed
-        today = datetime.utcnow().date()
-        now = datetime.utcnow()
-        if not qrcode.active or meeting.event.data_final < today or (meeting.data != today and not ((now.hour >= 18 and now.hour < 23) or (now.hour == 23 and now.minute <= 30))):
+        if checkin.is_closed(entry):
             flash('Inscrições encerradas para este QR code', 'danger')
             return redirect(url_for('main.scan', token=token))
         nome = request.form.get('nome', '').strip().upper()
@@ -114,31 +91,102 @@ def register(token):
         reg = Region.query.get(region_id)
         user = User(telefone=telefone, nome=nome, cor=reg.nome if reg else '', region=reg, email=email)
         db.session.add(user)
-        db.session.commit()
-        # create attendance record
+        db.session.flush()
+        # create attendance record in the same transaction as the user
         from zoneinfo import ZoneInfo
-        att = Attendance(meeting=meeting, user=user,
-                         confirmado_em=datetime.now(ZoneInfo('America/Sao_Paulo')))
-        db.session.add(att)
+        confirmado_em = datetime.now(ZoneInfo('America/Sao_Paulo'))
+        att_id = checkin.record_attendance(meeting.id, user.id, confirmado_em=confirmado_em)
         db.session.commit()
+        live.attendance_added(meeting.id, user, confirmado_em, att_id)
         # no external notifications
         return render_template('confirm.html', user=user, meeting=meeting, simple=True)
     return render_template('register.html', telefone=telefone, regions=regions, simple=True)
 
 
 
+# async versions of scan/register, swapped in by app.aio when ASYNC_CHECKIN is
+# set; they must behave exactly like the sync views above
+
+async def scan_async(token):
+    from app import aio
+    async with aio.session() as s:
+        entry = await aio.resolve(s, token)
+        if entry is None:
+            abort(404)
+        meeting = entry.meeting
+        if not entry.active and entry.replacement:
+            return redirect(url_for('main.scan', token=entry.replacement))
+        if checkin.is_closed(entry):
+            flash('Inscrições encerradas para este QR code', 'danger')
+            return render_template('scan.html', token=token, meeting=meeting, datetime=datetime, closed=True, simple=True)
+        if request.method == 'POST':
+            telefone = ''.join(ch for ch in (request.form.get('telefone') or '') if ch.isdigit())
+            if not telefone:
+                flash('Informe o telefone', 'danger')
+                return redirect(url_for('main.scan', token=token))
+            user = await aio.user_by_phone(s, telefone)
+            if user is None:
+                return redirect(url_for('main.register', token=token, telefone=telefone))
+            from zoneinfo import ZoneInfo
+            confirmado_em = datetime.now(ZoneInfo('America/Sao_Paulo'))
+            jr = journal.get()
+            att_id = None
+            if jr is not None:
+                created = await jr.record_async(s, meeting.id, user.id, confirmado_em)
+            else:
+                att_id = await aio.record_attendance(s, meeting.id, user.id, confirmado_em=confirmado_em)
+                await s.commit()
+                created = att_id is not None
+            if created:
+                # journalled check-ins reach the live tables once flushed
+                live.attendance_added(meeting.id, user, confirmado_em, att_id)
+                flash('Presença confirmada!', 'success')
+            else:
+                flash('Telefone já registrado nesta reunião', 'info')
+            return render_template('confirm.html', user=user, meeting=meeting, simple=True)
+    return render_template('scan.html', token=token, meeting=meeting, datetime=datetime, simple=True)
+
+
+async def register_async(token):
+    from app import aio
+    telefone = ''.join(ch for ch in (request.args.get('telefone') or '') if ch.isdigit())
+    if not telefone:
+        return redirect(url_for('main.scan', token=token))
+    async with aio.session() as s:
+        entry = await aio.resolve(s, token)
+        if entry is None:
+            abort(404)
+        meeting = entry.meeting
+        if request.method == 'POST':
+            if checkin.is_closed(entry):
+                flash('Inscrições encerradas para este QR code', 'danger')
+                return redirect(url_for('main.scan', token=token))
+            nome = request.form.get('nome', '').strip().upper()
+            region_id = request.form.get('region_id')
+            email = request.form.get('email')
+            if not nome or not region_id:
+                flash('Nome e região são obrigatórios', 'danger')
+                return redirect(url_for('main.register', token=token, telefone=telefone))
+            reg = await s.get(Region, region_id)
+            user = User(telefone=telefone, nome=nome, cor=reg.nome if reg else '', region=reg, email=email)
+            s.add(user)
+            await s.flush()
+            from zoneinfo import ZoneInfo
+            confirmado_em = datetime.now(ZoneInfo('America/Sao_Paulo'))
+            att_id = await aio.record_attendance(s, meeting.id, user.id, confirmado_em=confirmado_em)
+            await s.commit()
+            live.attendance_added(meeting.id, user, confirmado_em, att_id)
+            return render_template('confirm.html', user=user, meeting=meeting, simple=True)
+        regions = (await s.execute(db.select(Region).order_by(Region.nome))).scalars().all()
+    return render_template('register.html', telefone=telefone, regions=regions, simple=True)
+
+
 @bp.route('/qrcode/image/<int:qrcode_id>')
 def public_qrcode_image(qrcode_id):
     qr = QRCode.query.get_or_404(qrcode_id)
-    base = current_app.config.get('SERVER_ADDRESS')
-    url = f"{base}/scan/{qr.token}"
-    img = qrcode.make(url)
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    buf.seek(0)
-    resp = make_response(buf.read())
-    resp.headers.set('Content-Type', 'image/png')
-    return resp
+    # same options as admin.qrcode_image
+    opts = qrimage.options(request.args) or abort(400)
+    return qrimage.image_response(qr.token, *opts)
 
 @bp.route('/request-access', methods=['GET','POST'])
 def request_access():
@@ -1,11 +1,20 @@
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from app import db, login
 
 
+def phone_digits(value):
+    """Phone number reduced to its digits, the form used for lookups."""
+    return ''.join(ch for ch in (value or '') if ch.isdigit())
+
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     telefone = db.Column(db.String(20), unique=True, nullable=False)
+    # digits-only copy of telefone, kept in sync by _sync_telefone_digits;
+    # every phone lookup goes through this indexed column
+    telefone_digits = db.Column(db.String(20), index=True)
     nome = db.Column(db.String(120), nullable=False)
     # keep cor field for backwards compatibility if some code uses it
     cor = db.Column(db.String(50), nullable=False)
@@ -18,6 +27,19 @@ class User(UserMixin, db.Model):
     # teams this user belongs to
     teams = db.relationship('Team', secondary='team_user', back_populates='users')
 
+    @validates('telefone')
+    def _sync_telefone_digits(self, key, value):
+        self.telefone_digits = phone_digits(value)
+        return value
+
+    @staticmethod
+    def by_phone(value):
+        """Look a user up by phone, ignoring any mask in either value."""
+        digits = phone_digits(value)
+        if not digits:
+            return None
+        return User.query.filter_by(telefone_digits=digits).first()
+
     def __repr__(self):
         return f"<User {self.telefone} - {self.nome}>"
 
@@ -111,12 +133,30 @@ class Meeting(db.Model):
     attendances = db.relationship('Attendance', back_populates='meeting', cascade='all, delete-orphan')
     qrcodes = db.relationship('QRCode', back_populates='meeting', cascade='all, delete-orphan')
     teams = db.relationship('Team', back_populates='meeting', cascade='all, delete-orphan')
+    stats = db.relationship('MeetingStat', cascade='all, delete-orphan')
 
     def __repr__(self):
         return f"<Meeting {self.titulo or self.data} for event {self.event.nome}>"
 
 
+class MeetingStat(db.Model):
+    """Attendance count per meeting and participant colour (user.cor).
+
+    Maintained by app.stats on every attendance write so the dashboard
+    reads one row per meeting/colour instead of counting attendances.
+    """
+    __tablename__ = 'meeting_stats'
+    meeting_id = db.Column(db.Integer, db.ForeignKey('meeting.id'), primary_key=True)
+    cor = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    # first attendance with this colour; orders the per-region breakdown
+    first_attendance_id = db.Column(db.Integer)
+
+
 class Attendance(db.Model):
+    # one confirmation per participant and meeting; check-ins rely on this
+    # index to insert idempotently (see app.checkin.record_attendance)
+    __table_args__ = (db.Index('uq_attendance_meeting_user', 'meeting_id', 'user_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     meeting_id = db.Column(db.Integer, db.ForeignKey('meeting.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
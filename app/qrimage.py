@@ -0,0 +1,248 @@
+"""Rendered QR code images.
+
+A QR code image only depends on what it encodes (SERVER_ADDRESS/scan/
+<token>) and how it is drawn, so renders are kept in a bounded in-process
+LRU keyed by (token, SERVER_ADDRESS, size, format, error correction),
+optionally backed by files in QR_IMAGE_DIR that every worker shares and
+that survive restarts.  Any client can ask for any size, format and level,
+so the directory is bounded like EXPORT_DIR: files are evicted by age
+(QR_IMAGE_DIR_MAX_AGE), then by total size (QR_IMAGE_DIR_MAX_BYTES), least
+recently used first.
+Responses carry a strong ETag derived from the same key; a conditional
+request is answered 304 without rendering.  Image URLs are by QR id while
+the image follows SERVER_ADDRESS and the token, so browsers only keep them
+for QR_IMAGE_MAX_AGE seconds and then revalidate.
+
+Images come as PNG, optionally at a given pixel size, or as SVG (one
+path, a subpath per run of dark modules), which the QR pages inline.
+The error correction level is selectable too.
+"""
+import hashlib
+import io
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import qrcode
+import qrcode.image.svg
+from flask import current_app, request
+from markupsafe import Markup
+
+
+MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# ?ecc= levels; M is qrcode's default
+ECC = {'L': qrcode.constants.ERROR_CORRECT_L, 'M': qrcode.constants.ERROR_CORRECT_M,
+       'Q': qrcode.constants.ERROR_CORRECT_Q, 'H': qrcode.constants.ERROR_CORRECT_H}
+# ?size= bounds in pixels; every size is rendered and cached separately
+MIN_SIZE = 64
+MAX_SIZE = 2048
+# seconds between scans of QR_IMAGE_DIR for eviction
+EVICT_INTERVAL = 60
+
+
+class SvgRunsImage(qrcode.image.svg.SvgPathImage):
+    """SvgPathImage drawing each horizontal run of dark modules as one
+    subpath instead of one per module, several times smaller."""
+
+    def process(self):
+        # path units are modules at the default box_size of 10
+        self._subpaths = []
+        for y, row in enumerate(self.modules, start=self.border):
+            x = 0
+            while x < len(row):
+                if not row[x]:
+                    x += 1
+                    continue
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                self._subpaths.append(f'M{start + self.border},{y}h{x - start}v1h{start - x}z')
+        super().process()
+
+
+def render(data, size=None, fmt='png', ecc='M'):
+    """Encoded image of a QR code for `data`.  PNGs of a given size are
+    drawn with whole-pixel modules and centred on a canvas of that size."""
+    qr = qrcode.QRCode(error_correction=ECC[ecc])
+    qr.add_data(data)
+    qr.make(fit=True)
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=SvgRunsImage)
+        if size:
+            img.get_image().set('width', f'{size}px')
+            img.get_image().set('height', f'{size}px')
+        return img.to_string()
+    if size:
+        qr.box_size = max(1, size // (qr.modules_count + 2 * qr.border))
+    img = qr.make_image().get_image()
+    if size and img.size[0] < size:
+        from PIL import Image
+        canvas = Image.new(img.mode, (size, size), 1)
+        offset = (size - img.size[0]) // 2
+        canvas.paste(img, (offset, offset))
+        img = canvas
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def etag(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+class ImageCache:
+    """Bounded LRU of rendered images, over an optional directory of files
+    bounded by age and total size."""
+
+    def __init__(self, max_entries=256, directory=None, max_age=30 * 86400,
+                 max_bytes=50 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._evicted = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{etag(key)}.{key[3]}')
+
+    def get_or_render(self, key, render):
+        """Image bytes for `key`, calling render() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        data = None
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # mark as recently used for the size-based eviction
+                os.utime(path)
+                self.disk_hits += 1
+            except FileNotFoundError:
+                pass
+        if data is None:
+            self.misses += 1
+            data = render()
+            if self.directory:
+                path = self._path(key)
+                tmp = f'{path}.{secrets.token_hex(4)}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                # scanning the directory on every render would cost more
+                # than the render
+                if time.time() - self._evicted >= EVICT_INTERVAL:
+                    self._evicted = time.time()
+                    self.evict()
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = data
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return data
+
+    def evict(self):
+        """Drop files older than max_age, then the least recently used ones
+        until the total fits max_bytes."""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            # half-written files belong to a running render unless abandoned
+            if entry.name.endswith('.tmp') and now - st.st_mtime < self.max_age:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for i, (mtime, size, path) in enumerate(files):
+            # the most recently used file stays even if it alone is too big
+            over = total > self.max_bytes and i < len(files) - 1
+            if now - mtime <= self.max_age and not over:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'size': size, 'max_entries': self.max_entries, 'directory': self.directory,
+                'max_age': self.max_age, 'max_bytes': self.max_bytes}
+
+
+def get(app=None):
+    app = app or current_app
+    return app.extensions.get('qr_images')
+
+
+def options(args):
+    """(size, fmt, ecc) from ?size=&format=&ecc=, or None if one is invalid."""
+    fmt = args.get('format', 'png')
+    ecc = args.get('ecc', 'M').upper()
+    size = args.get('size', type=int)
+    if fmt not in MIMETYPES or ecc not in ECC:
+        return None
+    if 'size' in args and (size is None or not MIN_SIZE <= size <= MAX_SIZE):
+        return None
+    return size, fmt, ecc
+
+
+def _key(token, size, fmt, ecc):
+    return (token, current_app.config.get('SERVER_ADDRESS'), size, fmt, ecc)
+
+
+def image(token, size=None, fmt='png', ecc='M'):
+    """Cached image bytes of the scan URL of `token`."""
+    key = _key(token, size, fmt, ecc)
+    return get().get_or_render(key, lambda: render(f'{key[1]}/scan/{token}', size, fmt, ecc))
+
+
+def inline_svg(token, ecc='M'):
+    """The SVG image, for templates to inline."""
+    return Markup(image(token, fmt='svg', ecc=ecc).decode('utf-8'))
+
+
+def image_response(token, size=None, fmt='png', ecc='M', private=False):
+    """Cached image of the scan URL of `token`, with ETag/304 handling;
+    `private` keeps shared caches from storing it (admin pages)."""
+    tag = etag(_key(token, size, fmt, ecc))
+    if request.if_none_match.contains(tag):
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(image(token, size, fmt, ecc), mimetype=MIMETYPES[fmt])
+    resp.set_etag(tag)
+    resp.headers['Cache-Control'] = (f"{'private' if private else 'public'}, "
+                                     f"max-age={current_app.config.get('QR_IMAGE_MAX_AGE', 300)}")
+    return resp
+
+
+def init_app(app):
+    app.extensions['qr_images'] = ImageCache(app.config.get('QR_IMAGE_CACHE_SIZE', 256),
+                                             app.config.get('QR_IMAGE_DIR') or None,
+                                             max_age=app.config.get('QR_IMAGE_DIR_MAX_AGE', 30 * 86400),
+                                             max_bytes=app.config.get('QR_IMAGE_DIR_MAX_BYTES', 50 * 1024 * 1024))
@@ -0,0 +1,175 @@
+"""Denormalised snapshot of one event for offline analysis.
+
+One row per attendance at the event's meetings, with the participant,
+region, meeting and team (the participant's team in that meeting, if
+any) alongside.  Written either as Parquet (requires the `pyarrow`
+package) with typed columns and dictionary-encoded names, or as a compact
+SQLite file: names go into lookup tables and the `attendance_full` view
+joins them back.  Rows are read from a yield_per cursor and written in
+batches of BATCH_SIZE, so snapshots of long events stay small in memory.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Attendance, Event, Meeting, Region, Team, User, team_user
+
+
+# rows fetched and written per batch (one Parquet row group each)
+BATCH_SIZE = 5000
+FORMATS = ('parquet', 'sqlite')
+
+COLUMNS = ['attendance_id', 'confirmado_em', 'event_id', 'event', 'meeting_id', 'meeting',
+           'meeting_data', 'meeting_special', 'user_id', 'nome', 'telefone', 'cor',
+           'region_id', 'region', 'team_id', 'team', 'team_leader']
+
+
+def available_formats():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return ('sqlite',)
+    return FORMATS
+
+
+def default_format():
+    return available_formats()[0]
+
+
+def batches(event_id, batch_size=BATCH_SIZE):
+    """Lists of up to batch_size rows (COLUMNS), in attendance id order."""
+    # a participant's team in a meeting; the lowest id if listed in several
+    teams = (db.select(team_user.c.user_id, Team.meeting_id, func.min(Team.id).label('team_id'))
+             .join(Team, Team.id == team_user.c.team_id)
+             .group_by(team_user.c.user_id, Team.meeting_id)
+             .subquery())
+    stmt = (db.select(Attendance.id, Attendance.confirmado_em, Event.id, Event.nome, Meeting.id,
+                      Meeting.titulo, Meeting.data, Meeting.special, User.id, User.nome,
+                      User.telefone, User.cor, Region.id, Region.nome, Team.id, Team.nome,
+                      Team.leader_id)
+            .join(Meeting, Attendance.meeting_id == Meeting.id)
+            .join(Event, Meeting.event_id == Event.id)
+            .join(User, Attendance.user_id == User.id)
+            .outerjoin(Region, User.region_id == Region.id)
+            .outerjoin(teams, (teams.c.user_id == User.id) & (teams.c.meeting_id == Meeting.id))
+            .outerjoin(Team, Team.id == teams.c.team_id)
+            .where(Meeting.event_id == event_id)
+            .order_by(Attendance.id)
+            .execution_options(yield_per=batch_size))
+    for part in db.session.execute(stmt).partitions():
+        rows = []
+        for (att_id, confirmado_em, ev_id, ev_nome, mt_id, titulo, data, special, user_id, nome,
+             telefone, cor, region_id, region, team_id, team, leader_id) in part:
+            rows.append((att_id, confirmado_em, ev_id, ev_nome, mt_id,
+                         titulo or data.strftime('%d/%m/%Y'), data, bool(special), user_id, nome,
+                         telefone, cor, region_id, region, team_id, team,
+                         team_id is not None and leader_id == user_id))
+        yield rows
+
+
+def _schema():
+    import pyarrow as pa
+    names = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('attendance_id', pa.int64()), ('confirmado_em', pa.timestamp('us')),
+        ('event_id', pa.int32()), ('event', names),
+        ('meeting_id', pa.int32()), ('meeting', names),
+        ('meeting_data', pa.date32()), ('meeting_special', pa.bool_()),
+        ('user_id', pa.int64()), ('nome', pa.string()), ('telefone', pa.string()), ('cor', names),
+        ('region_id', pa.int32()), ('region', names),
+        ('team_id', pa.int32()), ('team', names), ('team_leader', pa.bool_()),
+    ])
+
+
+def write_parquet(event_id, path, batch_size=BATCH_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _schema()
+    count = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in batches(event_id, batch_size):
+            columns = list(zip(*rows))
+            arrays = []
+            for field, values in zip(schema, columns):
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(values, pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(values, field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+SQLITE_SCHEMA = '''
+CREATE TABLE event (id INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE meeting (id INTEGER PRIMARY KEY, event_id INTEGER NOT NULL, nome TEXT NOT NULL,
+                      data TEXT NOT NULL, special INTEGER NOT NULL);
+CREATE TABLE region (id INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE team (id INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE participant (id INTEGER PRIMARY KEY, nome TEXT NOT NULL, telefone TEXT NOT NULL,
+                          cor TEXT, region_id INTEGER);
+CREATE TABLE attendance (id INTEGER PRIMARY KEY, confirmado_em TEXT, meeting_id INTEGER NOT NULL,
+                         user_id INTEGER NOT NULL, team_id INTEGER, team_leader INTEGER NOT NULL);
+CREATE VIEW attendance_full AS
+SELECT a.id AS attendance_id, a.confirmado_em, e.id AS event_id, e.nome AS event,
+       m.id AS meeting_id, m.nome AS meeting, m.data AS meeting_data, m.special AS meeting_special,
+       p.id AS user_id, p.nome, p.telefone, p.cor, r.id AS region_id, r.nome AS region,
+       t.id AS team_id, t.nome AS team, a.team_leader
+FROM attendance a
+JOIN meeting m ON m.id = a.meeting_id
+JOIN event e ON e.id = m.event_id
+JOIN participant p ON p.id = a.user_id
+LEFT JOIN region r ON r.id = p.region_id
+LEFT JOIN team t ON t.id = a.team_id;
+'''
+
+
+def write_sqlite(event_id, path, batch_size=BATCH_SIZE):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    count = 0
+    try:
+        conn.executescript(SQLITE_SCHEMA)
+        for rows in batches(event_id, batch_size):
+            conn.executemany('INSERT OR IGNORE INTO event VALUES (?, ?)',
+                             {(r[2], r[3]) for r in rows})
+            conn.executemany('INSERT OR IGNORE INTO meeting VALUES (?, ?, ?, ?, ?)',
+                             {(r[4], r[2], r[5], r[6].isoformat(), r[7]) for r in rows})
+            conn.executemany('INSERT OR IGNORE INTO region VALUES (?, ?)',
+                             {(r[12], r[13]) for r in rows if r[12] is not None})
+            conn.executemany('INSERT OR IGNORE INTO team VALUES (?, ?)',
+                             {(r[14], r[15]) for r in rows if r[14] is not None})
+            conn.executemany('INSERT OR IGNORE INTO participant VALUES (?, ?, ?, ?, ?)',
+                             {(r[8], r[9], r[10], r[11], r[12]) for r in rows})
+            conn.executemany('INSERT INTO attendance VALUES (?, ?, ?, ?, ?, ?)',
+                             [(r[0], r[1].isoformat(sep=' ') if r[1] else None, r[4], r[8],
+                               r[14], r[16]) for r in rows])
+            count += len(rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def write(event_id, path, fmt=None, batch_size=BATCH_SIZE):
+    """Write the snapshot; returns the number of attendance rows."""
+    fmt = fmt or default_format()
+    if fmt == 'parquet':
+        return write_parquet(event_id, path, batch_size)
+    if fmt == 'sqlite':
+        return write_sqlite(event_id, path, batch_size)
+    raise ValueError(f'unknown snapshot format: {fmt}')
+
+
+class Snapshot:
+    """Deferred snapshot, saved by app.jobs like a workbook."""
+
+    def __init__(self, event_id, fmt):
+        self.event_id = event_id
+        self.fmt = fmt
+
+    def save(self, path):
+        write(self.event_id, path, self.fmt)
@@ -0,0 +1,256 @@
+"""Attendance statistics for the admin dashboard and its export.
+
+Counts per meeting and colour come from the meeting_stats rollup, which
+every attendance write keeps up to date in the same transaction:
+
+* single check-ins (scan, register, API) add one with count_stmt();
+* bulk inserts and deletes (batch API, journal flush, admin deletes,
+  colour changes) recount the meetings they touched with recount().
+
+`flask stats rebuild` recomputes the whole table and checks it.  The
+output matches what the dashboard used to build by hand, including the
+order of the per-region dicts (first attendee of each colour wins),
+which drives the column order of the exported spreadsheet.
+"""
+from collections import namedtuple
+
+from sqlalchemy import func, case, or_, and_, literal
+
+from app import db
+from app.models import Event, Meeting, Attendance, User, MeetingStat, QRCode, Region
+
+
+# session-independent rows, safe to keep in app.cache between requests
+OpenQR = namedtuple('OpenQR', 'id token meeting')
+RegionRow = namedtuple('RegionRow', 'id nome')
+
+ROLLUP_COLUMNS = ('meeting_id', 'cor', 'total', 'first_attendance_id')
+
+
+def count_stmt(meeting_id, user_id, attendance_id, dialect=None):
+    """Statement adding one new attendance to the rollup, under the
+    participant's current colour.  Runs in the caller's transaction."""
+    dialect = dialect or db.session.get_bind().dialect.name
+    table = MeetingStat.__table__
+    source = (db.select(literal(meeting_id), User.cor, literal(1), literal(attendance_id))
+              .where(User.id == user_id))
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        return (insert(table).from_select(ROLLUP_COLUMNS, source)
+                .on_conflict_do_update(index_elements=['meeting_id', 'cor'],
+                                       set_={'total': table.c.total + 1}))
+    # MySQL / MariaDB
+    from sqlalchemy.dialects.mysql import insert
+    return (insert(table).from_select(ROLLUP_COLUMNS, source)
+            .on_duplicate_key_update(total=table.c.total + 1))
+
+
+def count_attendance(meeting_id, user_id, attendance_id):
+    db.session.execute(count_stmt(meeting_id, user_id, attendance_id))
+
+
+def _grouped(meeting_ids=None):
+    q = (db.select(Attendance.meeting_id, User.cor, func.count(Attendance.id), func.min(Attendance.id))
+         .join(User, Attendance.user_id == User.id)
+         .group_by(Attendance.meeting_id, User.cor))
+    if meeting_ids is not None:
+        q = q.where(Attendance.meeting_id.in_(meeting_ids))
+    return q
+
+
+def recount(meeting_ids=None):
+    """Recompute the rollup rows of the given meetings (all when None)
+    from the attendance table.  The caller commits."""
+    from app.checkin import _chunks
+    table = MeetingStat.__table__
+    # pending ORM deletes (e.g. delete_attendance) must hit the table first
+    db.session.flush()
+    if meeting_ids is None:
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(ROLLUP_COLUMNS, _grouped()))
+        return
+    for chunk in _chunks(set(meeting_ids)):
+        db.session.execute(table.delete().where(table.c.meeting_id.in_(chunk)))
+        db.session.execute(table.insert().from_select(ROLLUP_COLUMNS, _grouped(chunk)))
+
+
+def attended(user_id):
+    """Ids of the meetings a user attended; collect before deleting the user."""
+    return [mid for (mid,) in db.session.query(Attendance.meeting_id).filter_by(user_id=user_id)]
+
+
+def verify():
+    """Rollup rows that disagree with the attendance table, as
+    (meeting_id, cor, stored, actual) with (total, first_attendance_id) pairs."""
+    actual = {(mid, cor): (n, first) for mid, cor, n, first in db.session.execute(_grouped())}
+    stored = {(r.meeting_id, r.cor): (r.total, r.first_attendance_id)
+              for r in MeetingStat.query.filter(MeetingStat.total > 0)}
+    return [(key[0], key[1], stored.get(key), actual.get(key))
+            for key in sorted(set(actual) | set(stored), key=lambda k: (k[0], k[1] or ''))
+            if stored.get(key) != actual.get(key)]
+
+
+def ordered_meetings():
+    """(meeting, event) copies in dashboard order: events by start date, meetings by date."""
+    from app.checkin import CachedEvent, CachedMeeting
+    rows = (db.session.query(Meeting.id, Meeting.titulo, Meeting.data,
+                             Event.id, Event.nome, Event.data_final)
+            .join(Event, Meeting.event_id == Event.id)
+            .order_by(Event.data_inicial, Event.id, Meeting.data, Meeting.id).all())
+    events = {}
+    pairs = []
+    for mid, titulo, data, eid, nome, data_final in rows:
+        ev = events.setdefault(eid, CachedEvent(eid, nome, data_final))
+        pairs.append((CachedMeeting(mid, titulo, data, ev), ev))
+    return pairs
+
+
+def open_qrcodes(today):
+    """Active QR codes whose event has not finished yet."""
+    from app.checkin import CachedEvent, CachedMeeting
+    rows = (db.session.query(QRCode.id, QRCode.token, Meeting.id, Meeting.titulo, Meeting.data,
+                             Event.id, Event.nome, Event.data_final)
+            .join(Meeting, QRCode.meeting_id == Meeting.id)
+            .join(Event, Meeting.event_id == Event.id)
+            .filter(QRCode.active.is_(True), Event.data_final >= today)
+            .order_by(QRCode.id).all())
+    return [OpenQR(qid, token, CachedMeeting(mid, titulo, data, CachedEvent(eid, nome, data_final)))
+            for qid, token, mid, titulo, data, eid, nome, data_final in rows]
+
+
+def regions():
+    return [RegionRow(rid, nome) for rid, nome in
+            db.session.query(Region.id, Region.nome).order_by(Region.nome).all()]
+
+
+def _filtered_meeting_ids(participant_q, region_id):
+    """Meetings with at least one attendee matching the filters, or None if unfiltered."""
+    if not participant_q and not region_id:
+        return None
+    q = (db.session.query(Attendance.meeting_id).join(User, Attendance.user_id == User.id)
+         .distinct())
+    ids = None
+    if participant_q:
+        # participant_q is already lower-case; names are usually stored upper-case,
+        # and SQLite's lower() only folds ASCII, so match both forms
+        cond = or_(func.lower(User.nome).contains(participant_q, autoescape=True),
+                   User.nome.contains(participant_q.upper(), autoescape=True),
+                   User.telefone.contains(participant_q, autoescape=True))
+        ids = {mid for (mid,) in q.filter(cond).all()}
+    if region_id:
+        region_ids = {mid for (mid,) in q.filter(User.region_id == region_id).all()}
+        ids = region_ids if ids is None else ids & region_ids
+    return ids
+
+
+def meeting_stats(participant_q='', region_id=None):
+    """One dict per meeting: event, meeting, total, by_region, new, missing.
+
+    `new`/`missing` compare each meeting with the previous meeting of the
+    same event (whether or not that one passes the filters).
+    """
+    rows = ordered_meetings()
+    if not rows:
+        return []
+    totals = {}
+    by_region = {}
+    region_rows = (db.session.query(MeetingStat.meeting_id, MeetingStat.cor, MeetingStat.total)
+                   .filter(MeetingStat.total > 0)
+                   .order_by(MeetingStat.meeting_id, MeetingStat.first_attendance_id).all())
+    for mid, cor, cnt in region_rows:
+        by_region.setdefault(mid, {})[cor] = cnt
+        totals[mid] = totals.get(mid, 0) + cnt
+
+    # previous meeting of the same event, then one self-join counts how many
+    # attendees each meeting shares with its predecessor (this depends on the
+    # meeting order, which edits can change, so it is not kept in the rollup)
+    prev_of = {}
+    last_by_event = {}
+    for mt, ev in rows:
+        if ev.id in last_by_event:
+            prev_of[mt.id] = last_by_event[ev.id]
+        last_by_event[ev.id] = mt.id
+    overlap = {}
+    if prev_of:
+        prev = db.aliased(Attendance)
+        overlap = dict(db.session.query(Attendance.meeting_id, func.count(Attendance.id))
+                       .join(prev, and_(prev.user_id == Attendance.user_id,
+                                        prev.meeting_id == case(prev_of, value=Attendance.meeting_id)))
+                       .filter(Attendance.meeting_id.in_(prev_of.keys()))
+                       .group_by(Attendance.meeting_id).all())
+
+    wanted = _filtered_meeting_ids(participant_q, region_id)
+    stats = []
+    for mt, ev in rows:
+        if wanted is not None and mt.id not in wanted:
+            continue
+        total = totals.get(mt.id, 0)
+        new = missing = 0
+        if mt.id in prev_of:
+            shared = overlap.get(mt.id, 0)
+            new = total - shared
+            missing = totals.get(prev_of[mt.id], 0) - shared
+        stats.append({'event': ev, 'meeting': mt, 'total': total,
+                      'by_region': by_region.get(mt.id, {}), 'new': new, 'missing': missing})
+    return stats
+
+
+def window(rows, events=None, offset=0, start=None, end=None):
+    """Limit meeting_stats() rows to meetings between `start` and `end`,
+    then to `events` events after skipping the `offset` most recent ones.
+
+    Returns (rows, has_more); has_more tells whether older events remain.
+    """
+    if start:
+        rows = [r for r in rows if r['meeting'].data >= start]
+    if end:
+        rows = [r for r in rows if r['meeting'].data <= end]
+    if not events:
+        return rows, False
+    event_ids = list(dict.fromkeys(r['event'].id for r in rows))
+    stop = max(0, len(event_ids) - offset)
+    begin = max(0, stop - events)
+    keep = set(event_ids[begin:stop])
+    return [r for r in rows if r['event'].id in keep], begin > 0
+
+
+def _label(row):
+    mt = row['meeting']
+    return f"{row['event'].nome} - {mt.titulo or mt.data.strftime('%d/%m/%Y')}"
+
+
+def attendance_chart(rows):
+    """Attendance per meeting, plus the rows of the dashboard's detail table."""
+    return {
+        'labels': [_label(r) for r in rows],
+        'totals': [r['total'] for r in rows],
+        'meetings': [{'evento': r['event'].nome,
+                      'reuniao': r['meeting'].titulo or r['meeting'].data.strftime('%d/%m/%Y'),
+                      'total': r['total'], 'novos': r['new'], 'faltaram': r['missing'],
+                      'por_regiao': list(r['by_region'].items())} for r in rows],
+    }
+
+
+def region_chart(rows):
+    """Attendances per colour over the rows, in order of first appearance."""
+    counts = {}
+    for r in rows:
+        for cor, cnt in r['by_region'].items():
+            counts[cor] = counts.get(cor, 0) + cnt
+    return {'labels': list(counts.keys()), 'totals': list(counts.values())}
+
+
+def region_meeting_chart(rows):
+    """One series per colour with a value for every meeting (0 when absent)."""
+    series = {}
+    for r in rows:
+        for cor in r['by_region']:
+            series.setdefault(cor, None)
+    return {
+        'labels': [_label(r) for r in rows],
+        'datasets': [{'label': cor, 'data': [r['by_region'].get(cor, 0) for r in rows]}
+                     for cor in series],
+    }
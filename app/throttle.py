@@ -0,0 +1,149 @@
+"""Admission control for the unauthenticated check-in endpoints.
+
+Requests to scan, register and request-access pass through per-IP and
+per-QR-token token buckets, and access request POSTs (a scrypt password
+hash each) share a small per-process concurrency cap.  Registrations are
+only rate limited: a guest at the door must not lose a filled-in form
+because a few others are registering at the same moment.  Rejections are answered with 429 before the
+view runs, so they never touch the database.
+
+Buckets live in memory by default; set THROTTLE_STORAGE_URL to a
+redis:// URL (requires the `redis` package) to share them between workers.
+"""
+import math
+import threading
+import time
+
+from flask import request, g, current_app, make_response
+
+
+# endpoint -> which limits apply
+PUBLIC_ENDPOINTS = {'main.scan', 'main.register', 'main.request_access'}
+TOKEN_ENDPOINTS = {'main.scan', 'main.register'}
+# POSTs that hash passwords (scrypt)
+EXPENSIVE_ENDPOINTS = {'main.request_access'}
+
+
+class MemoryStore:
+    """Token buckets for a single process."""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now=None):
+        """Take one token; returns 0 when admitted, otherwise seconds to wait."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            # each bucket keeps its own limits for pruning
+            self._buckets[key] = (tokens, now, rate, burst)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        # a bucket that has refilled completely is the same as no bucket
+        full = [k for k, (tokens, last, rate, burst) in self._buckets.items()
+                if tokens + (now - last) * rate >= burst]
+        for k in full:
+            del self._buckets[k]
+
+
+class RedisStore:
+    """Token buckets shared by every worker through Redis."""
+
+    SCRIPT = '''
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local b = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+    local tokens = tonumber(b[1]) or burst
+    local last = tonumber(b[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    '''
+
+    def __init__(self, url, prefix='f2f:throttle:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst, now=None):
+        now = time.time() if now is None else now
+        return float(self._take(keys=[self.prefix + key], args=[rate, burst, now]))
+
+
+def make_store(url):
+    if not url or url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    raise ValueError(f'unsupported THROTTLE_STORAGE_URL: {url}')
+
+
+def _client_ip():
+    if current_app.config.get('THROTTLE_TRUST_FORWARDED'):
+        return request.access_route[0] if request.access_route else request.remote_addr
+    return request.remote_addr or '-'
+
+
+def _reject(wait):
+    resp = make_response('Muitas requisições, tente novamente em instantes.', 429)
+    resp.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+    resp.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    return resp
+
+
+def _admit():
+    if request.endpoint not in PUBLIC_ENDPOINTS:
+        return None
+    cfg = current_app.config
+    state = current_app.extensions['throttle']
+    store = state['store']
+    ip = _client_ip()
+    wait = store.take(f'ip:{ip}', cfg['THROTTLE_IP_RATE'], cfg['THROTTLE_IP_BURST'])
+    if not wait and request.endpoint == 'main.request_access' and request.method == 'POST':
+        wait = store.take(f'access:{ip}', cfg['THROTTLE_ACCESS_RATE'], cfg['THROTTLE_ACCESS_BURST'])
+    if not wait and request.endpoint in TOKEN_ENDPOINTS:
+        token = (request.view_args or {}).get('token', '')
+        wait = store.take(f'token:{token}', cfg['THROTTLE_TOKEN_RATE'], cfg['THROTTLE_TOKEN_BURST'])
+    if wait:
+        return _reject(wait)
+    if request.endpoint in EXPENSIVE_ENDPOINTS and request.method == 'POST':
+        if not state['slots'].acquire(blocking=False):
+            return _reject(1)
+        g.throttle_slot = True
+    return None
+
+
+def _release(exc=None):
+    if g.pop('throttle_slot', False):
+        current_app.extensions['throttle']['slots'].release()
+
+
+def init_app(app):
+    if not app.config.get('THROTTLE_ENABLED', True):
+        return
+    app.extensions['throttle'] = {
+        'store': make_store(app.config.get('THROTTLE_STORAGE_URL')),
+        'slots': threading.BoundedSemaphore(app.config.get('THROTTLE_MAX_CONCURRENT', 4)),
+    }
+    app.before_request(_admit)
+    app.teardown_request(_release)
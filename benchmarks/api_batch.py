@@ -0,0 +1,98 @@
+"""Replay of an offline scanner's queue through POST /api/attendance/batch.
+
+Seeds a throw-away SQLite database with one meeting and --records
+participants and posts one batch holding a check-in for each of them,
+mixed with malformed records (a token or telefone of the wrong JSON
+type, a bad timestamp), an unknown QR token, an unknown phone and a
+repeated check-in.  Every record must get its own status without the
+malformed ones failing the batch; posting the batch again must report
+every check-in as already registered.  Prints the timings and exits
+non-zero otherwise.
+
+    python benchmarks/api_batch.py --records 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+TOKEN = 'bench-token'
+
+# (record, expected status)
+ODD_RECORDS = [
+    ({'token': [TOKEN], 'telefone': '55000000000'}, 'invalid record'),
+    ({'token': {'t': TOKEN}, 'telefone': '55000000000'}, 'invalid record'),
+    ({'token': TOKEN, 'telefone': ['55000000000']}, 'invalid record'),
+    ({'token': TOKEN, 'telefone': True}, 'invalid record'),
+    ({'token': TOKEN, 'telefone': '55000000000', 'scanned_at': 'yesterday'}, 'invalid record'),
+    ({'token': TOKEN, 'telefone': '55000000000', 'scanned_at': [1]}, 'invalid record'),
+    ('not a record', 'invalid record'),
+    ({'token': 'no-such-token', 'telefone': '55000000000'}, 'invalid qrcode'),
+    ({'token': TOKEN, 'telefone': '11999999999'}, 'user not found'),
+    ({'token': TOKEN, 'telefone': '55000000000'}, 'already registered'),
+]
+
+
+def make_config(uri):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        THROTTLE_ENABLED = False
+        TESTING = True
+    return BenchConfig
+
+
+def seed(app, n):
+    from app.models import Event, Meeting, QRCode, Setting, User
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        ev = Event(nome='BENCH', data_inicial=today, data_final=today + timedelta(days=1))
+        mt = Meeting(event=ev, titulo='BENCH', data=today)
+        db.session.add_all([ev, mt, QRCode(meeting=mt, token=TOKEN, active=True)])
+        db.session.add_all(User(telefone=f'55{i:09d}', nome=f'BENCH {i}', cor='Azul') for i in range(n))
+        db.session.commit()
+        Setting.set('API_TOKEN', 'bench')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='f2f-bench-')
+    app = create_app(make_config('sqlite:///' + os.path.join(tmpdir, 'bench.db')))
+    seed(app, args.records)
+
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    records = [{'token': TOKEN, 'telefone': f'55{i:09d}',
+                'scanned_at': (start + timedelta(seconds=i)).isoformat()} for i in range(args.records)]
+    expected = ['ok'] * args.records
+    # spread the odd records through the batch
+    step = max(1, args.records // len(ODD_RECORDS))
+    for n, (rec, status) in enumerate(ODD_RECORDS):
+        at = min(len(records), (n + 1) * step)
+        records.insert(at, rec)
+        expected.insert(at, status)
+
+    client = app.test_client()
+    for attempt in ('first', 'again'):
+        began = time.perf_counter()
+        resp = client.post('/api/attendance/batch?token=bench', json=records)
+        elapsed = time.perf_counter() - began
+        assert resp.status_code == 200, f'{attempt} post: HTTP {resp.status_code}'
+        body = resp.get_json()
+        print(f'{attempt}: {len(records)} records in {elapsed:.2f}s; {body["totals"]}')
+        assert body['results'] == expected, f'{attempt} post: unexpected statuses'
+        expected = ['already registered' if s == 'ok' else s for s in expected]
+
+
+if __name__ == '__main__':
+    main()
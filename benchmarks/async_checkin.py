@@ -0,0 +1,86 @@
+"""Concurrent check-in throughput: sync views vs ASYNC_CHECKIN views.
+
+Seeds a throw-away SQLite database, then fires POST /api/attendance for
+distinct participants from a pool of threads against each variant of the
+app (in-process, through the Flask test client) and prints requests/s.
+
+    python benchmarks/async_checkin.py --requests 2000 --concurrency 32
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+def make_config(uri, async_checkin):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        ASYNC_CHECKIN = async_checkin
+        THROTTLE_ENABLED = False
+        TESTING = True
+    return BenchConfig
+
+
+def seed(app, n_users):
+    from app.models import Event, Meeting, QRCode, User, Setting
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        ev = Event(nome='BENCH', data_inicial=today, data_final=today + timedelta(days=1))
+        mt = Meeting(event=ev, titulo='BENCH', data=today)
+        db.session.add_all([ev, mt, QRCode(meeting=mt, token='bench-token', active=True)])
+        db.session.add_all([User(telefone=f'55{i:09d}', nome=f'BENCH {i}', cor='') for i in range(n_users)])
+        db.session.commit()
+        Setting.set('API_TOKEN', 'bench')
+
+
+def run(app, n_requests, concurrency):
+    from app.models import Attendance
+    with app.app_context():
+        db.session.query(Attendance).delete()
+        db.session.commit()
+
+    def hit(i):
+        client = app.test_client()
+        r = client.post('/api/attendance?token=bench',
+                        json={'token': 'bench-token', 'telefone': f'55{i:09d}'})
+        return r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        codes = list(pool.map(hit, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    errors = sum(1 for c in codes if c != 200)
+    return n_requests / elapsed, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--database', help='SQLAlchemy URL (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='f2f-bench-')
+    uri = args.database or 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    if not args.database:
+        seed_app = create_app(make_config(uri, False))
+        seed(seed_app, args.requests)
+
+    for label, async_checkin in (('sync', False), ('async', True)):
+        app = create_app(make_config(uri, async_checkin))
+        rps, elapsed, errors = run(app, args.requests, args.concurrency)
+        print(f'{label:>5}: {rps:8.1f} check-ins/s  ({args.requests} in {elapsed:.2f}s, '
+              f'{args.concurrency} threads, {errors} errors)')
+
+
+if __name__ == '__main__':
+    main()
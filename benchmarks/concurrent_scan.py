@@ -0,0 +1,94 @@
+"""Many simultaneous check-ins of one participant on one QR token.
+
+Seeds a throw-away SQLite database (or uses --database) with one meeting,
+its QR token and one participant, then POSTs /scan/<token> for that
+participant from a pool of threads (--threads x --repeat requests).
+Exactly one attendance row must result, and the meeting_stats rollup must
+count it once; the script prints the outcome and exits non-zero otherwise.
+
+    python benchmarks/concurrent_scan.py --threads 16 --repeat 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+TOKEN = 'bench-token'
+TELEFONE = '55000000001'
+
+
+def make_config(uri):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        THROTTLE_ENABLED = False
+        TESTING = True
+    return BenchConfig
+
+
+def seed(app):
+    from app.models import Attendance, Event, Meeting, MeetingStat, QRCode, User
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        ev = Event(nome='BENCH', data_inicial=today, data_final=today + timedelta(days=1))
+        mt = Meeting(event=ev, titulo='BENCH', data=today)
+        db.session.add_all([ev, mt, QRCode(meeting=mt, token=TOKEN, active=True),
+                            User(telefone=TELEFONE, nome='BENCH', cor='Azul')])
+        db.session.flush()
+        db.session.query(Attendance).filter_by(meeting_id=mt.id).delete()
+        db.session.query(MeetingStat).filter_by(meeting_id=mt.id).delete()
+        db.session.commit()
+        return mt.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database', help='SQLAlchemy URL (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='f2f-bench-')
+    uri = args.database or 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    app = create_app(make_config(uri))
+    meeting_id = seed(app)
+
+    # every thread fires its first request at the same moment
+    barrier = threading.Barrier(args.threads)
+
+    def hammer(_):
+        client = app.test_client()
+        barrier.wait()
+        return [client.post(f'/scan/{TOKEN}', data={'telefone': TELEFONE}).status_code
+                for _ in range(args.repeat)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        codes = Counter(c for result in pool.map(hammer, range(args.threads)) for c in result)
+    elapsed = time.perf_counter() - start
+
+    from sqlalchemy import func
+    from app.models import Attendance, MeetingStat
+    with app.app_context():
+        rows = db.session.query(func.count(Attendance.id)).filter_by(meeting_id=meeting_id).scalar()
+        rollup = (db.session.query(func.coalesce(func.sum(MeetingStat.total), 0))
+                  .filter_by(meeting_id=meeting_id).scalar())
+    print(f'{args.threads * args.repeat} scans from {args.threads} threads in {elapsed:.2f}s; '
+          f'status codes {dict(codes)}; {rows} attendance row(s), rollup {rollup}')
+    assert rows == 1, f'expected exactly one attendance row, found {rows}'
+    assert rollup == 1, f'expected a rollup count of 1, found {rollup}'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Flush the check-in journal while a live attendance stream is open.
+
+Seeds a throw-away SQLite database with one meeting and --users
+participants, checks them all in through /scan/<token> with the
+write-behind journal on (ATTENDANCE_JOURNAL), subscribes to the meeting's
+live stream and drains the journal in batches of --batch.  Every row must
+reach the attendance table, leave the journal, and be published once to
+the subscriber with its attendance id; exits non-zero otherwise.
+
+    python benchmarks/journal_live.py --users 50 --batch 20
+"""
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+
+
+TOKEN = 'bench-token'
+
+
+def make_config(uri, journal):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        THROTTLE_ENABLED = False
+        TESTING = True
+        # the background thread stays asleep; the script drains by hand
+        ATTENDANCE_JOURNAL = journal
+        ATTENDANCE_JOURNAL_BATCH = 1000000
+        ATTENDANCE_JOURNAL_FLUSH_MS = 3600 * 1000
+    return BenchConfig
+
+
+def seed(app, n):
+    from app.models import Event, Meeting, QRCode, User
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        ev = Event(nome='BENCH', data_inicial=today, data_final=today + timedelta(days=1))
+        mt = Meeting(event=ev, titulo='BENCH', data=today)
+        db.session.add_all([ev, mt, QRCode(meeting=mt, token=TOKEN, active=True)])
+        db.session.add_all(User(telefone=f'55{i:09d}', nome=f'BENCH {i}', cor='Azul') for i in range(n))
+        db.session.commit()
+        return mt.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='f2f-bench-')
+    app = create_app(make_config('sqlite:///' + os.path.join(tmpdir, 'bench.db'),
+                                 os.path.join(tmpdir, 'journal.db')))
+    meeting_id = seed(app, args.users)
+    client = app.test_client()
+    for i in range(args.users):
+        client.post(f'/scan/{TOKEN}', data={'telefone': f'55{i:09d}'})
+
+    from app import journal, live
+    from app.models import Attendance
+    jr = journal.get(app)
+    jr.batch_size = args.batch
+    q = live.subscribe(meeting_id)
+    try:
+        start = time.perf_counter()
+        jr.drain()
+        elapsed = time.perf_counter() - start
+    finally:
+        live.unsubscribe(meeting_id, q)
+    ids = []
+    while True:
+        try:
+            event, data = q.get_nowait()
+        except queue.Empty:
+            break
+        if event == 'added':
+            ids.append(data['id'])
+    with app.app_context():
+        stored = {att_id for att_id, in db.session.query(Attendance.id).filter_by(meeting_id=meeting_id)}
+    print(f'{args.users} journalled check-ins drained in {elapsed:.2f}s; {len(stored)} stored, '
+          f'{jr.pending()} left in the journal, {len(ids)} published')
+    assert len(stored) == args.users, 'journalled rows missing from the attendance table'
+    assert jr.pending() == 0, 'flushed rows left in the journal'
+    assert sorted(ids) == sorted(stored), 'live stream did not get every stored row once'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""PDF attendance report build time for large meetings and events.
+
+Seeds a throw-away SQLite database with one event whose meetings each
+have up to --rows participants, then builds the per-meeting list and the
+event matrix PDFs (app.exports) several times and prints the timings.
+
+    python benchmarks/pdf_exports.py --rows 5000 --meetings 6 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db, exports  # noqa: E402
+
+
+def make_config(uri):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = uri
+        TESTING = True
+    return BenchConfig
+
+
+def seed(app, n_rows, n_meetings):
+    from sqlalchemy import insert
+    from app.models import Attendance, Event, Meeting, User
+    with app.app_context():
+        db.create_all()
+        today = date.today()
+        ev = Event(nome='BENCH', data_inicial=today - timedelta(days=n_meetings), data_final=today)
+        meetings = [Meeting(event=ev, titulo=f'BENCH {i}', data=today - timedelta(days=i))
+                    for i in range(n_meetings)]
+        db.session.add_all([ev] + meetings)
+        db.session.flush()
+        db.session.execute(insert(User), [
+            {'telefone': f'55{i:09d}', 'telefone_digits': f'55{i:09d}',
+             'nome': f'BENCH {i * 7919 % n_rows:05d}', 'cor': ('Azul', 'Verde', 'Amarela')[i % 3]}
+            for i in range(n_rows)])
+        user_ids = [uid for (uid,) in db.session.query(User.id).filter(User.nome.like('BENCH %'))]
+        # the first meeting has everyone, the others about two thirds
+        db.session.execute(insert(Attendance), [
+            {'meeting_id': mt.id, 'user_id': uid}
+            for n, mt in enumerate(meetings) for uid in user_ids
+            if n == 0 or (uid * (n + 1)) % 3])
+        db.session.commit()
+        return ev.id, meetings[0].id
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(out.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--meetings', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='f2f-bench-')
+    app = create_app(make_config('sqlite:///' + os.path.join(tmpdir, 'bench.db')))
+    event_id, meeting_id = seed(app, args.rows, args.meetings)
+
+    from app.models import Event, Meeting
+    with app.test_request_context():
+        ev = db.session.get(Event, event_id)
+        mt = db.session.get(Meeting, meeting_id)
+        meetings = sorted(ev.meetings, key=lambda m: m.data)
+        for label, build in (('meeting', lambda: exports.meeting_pdf(mt)),
+                             ('event', lambda: exports.event_pdf(ev, meetings))):
+            best, size = timed(build, args.repeat)
+            print(f'{label:>7}: {best:6.2f}s  ({args.rows} rows, {args.meetings} meetings, '
+                  f'{size / 1024:.0f} KiB, best of {args.repeat})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Token bucket store under a flood of distinct keys.
+
+Drains an access bucket (THROTTLE_ACCESS_RATE/BURST), then floods the
+in-memory store with one new token bucket per request, as requests for
+random /scan/<token> URLs do, well past its max_keys.  Pruning must only
+drop buckets that refilled under their own limits: the access bucket
+has to stay exhausted.  Prints the flood rate and exits non-zero if not.
+
+    python benchmarks/throttle_store.py --keys 50000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app.throttle import MemoryStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=50000)
+    parser.add_argument('--max-keys', type=int, default=10000)
+    args = parser.parse_args()
+
+    store = MemoryStore(max_keys=args.max_keys)
+    access = (Config.THROTTLE_ACCESS_RATE, Config.THROTTLE_ACCESS_BURST)
+    token = (Config.THROTTLE_TOKEN_RATE, Config.THROTTLE_TOKEN_BURST)
+    now = 0.0
+    for _ in range(access[1]):
+        store.take('access:10.0.0.1', *access, now=now)
+    expected = store.take('access:10.0.0.1', *access, now=now)
+
+    # the flood spans 30s: a token bucket refills many times over, the
+    # access bucket earns 1.5 tokens (a full refill takes burst / rate)
+    start = time.perf_counter()
+    for i in range(args.keys):
+        now = 30.0 * i / args.keys
+        store.take(f'token:{i}', *token, now=now)
+    elapsed = time.perf_counter() - start
+
+    store.take('access:10.0.0.1', *access, now=now)
+    wait = store.take('access:10.0.0.1', *access, now=now)
+    print(f'{args.keys / elapsed:,.0f} takes/s, {len(store._buckets)} buckets kept; '
+          f'access wait {expected:.1f}s before the flood, {wait:.1f}s for the second take after')
+    assert wait > 0, 'exhausted access bucket was pruned'
+    assert len(store._buckets) <= args.max_keys + 1, 'store grew past max_keys'
+
+
+if __name__ == '__main__':
+    main()
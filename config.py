@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -15,3 +16,63 @@ class Config:
     # base URL used for external links (override with env var if needed)
     SERVER_ADDRESS = os.environ.get('SERVER_ADDRESS', 'http://31.97.251.198:5000')
 
+    # seconds a resolved QR token stays in the in-process check-in cache;
+    # bounds staleness when several workers each hold their own copy
+    QR_CACHE_TTL = int(os.environ.get('QR_CACHE_TTL', 30))
+    # rendered QR images kept in memory per worker (0 disables it), an
+    # optional directory shared by the workers, and how long browsers keep
+    # them before revalidating (image URLs are by QR id, while the image
+    # follows SERVER_ADDRESS and the token; the ETag makes a revalidation
+    # a 304)
+    QR_IMAGE_CACHE_SIZE = int(os.environ.get('QR_IMAGE_CACHE_SIZE', 256))
+    QR_IMAGE_DIR = os.environ.get('QR_IMAGE_DIR')
+    QR_IMAGE_MAX_AGE = int(os.environ.get('QR_IMAGE_MAX_AGE', 300))
+    # QR_IMAGE_DIR files are evicted after QR_IMAGE_DIR_MAX_AGE seconds or,
+    # least recently used first, beyond QR_IMAGE_DIR_MAX_BYTES
+    QR_IMAGE_DIR_MAX_AGE = int(os.environ.get('QR_IMAGE_DIR_MAX_AGE', 30 * 86400))
+    QR_IMAGE_DIR_MAX_BYTES = int(os.environ.get('QR_IMAGE_DIR_MAX_BYTES', 50 * 1024 * 1024))
+    # largest number of records accepted by POST /api/attendance/batch
+    API_BATCH_MAX = int(os.environ.get('API_BATCH_MAX', 10000))
+    # path of the write-behind check-in journal (SQLite file); unset keeps
+    # the default of committing every scan directly to the database
+    ATTENDANCE_JOURNAL = os.environ.get('ATTENDANCE_JOURNAL')
+    ATTENDANCE_JOURNAL_BATCH = int(os.environ.get('ATTENDANCE_JOURNAL_BATCH', 200))
+    ATTENDANCE_JOURNAL_FLUSH_MS = int(os.environ.get('ATTENDANCE_JOURNAL_FLUSH_MS', 500))
+    # admission control for /scan, /register and /request-access
+    # (rates in requests per second, bursts in requests); a venue's guests
+    # usually share one NAT address, so the per-IP limit is generous
+    THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', '1') != '0'
+    THROTTLE_STORAGE_URL = os.environ.get('THROTTLE_STORAGE_URL', 'memory://')
+    THROTTLE_TRUST_FORWARDED = os.environ.get('THROTTLE_TRUST_FORWARDED', '0') == '1'
+    THROTTLE_IP_RATE = float(os.environ.get('THROTTLE_IP_RATE', 5))
+    THROTTLE_IP_BURST = int(os.environ.get('THROTTLE_IP_BURST', 60))
+    THROTTLE_TOKEN_RATE = float(os.environ.get('THROTTLE_TOKEN_RATE', 20))
+    THROTTLE_TOKEN_BURST = int(os.environ.get('THROTTLE_TOKEN_BURST', 300))
+    THROTTLE_ACCESS_RATE = float(os.environ.get('THROTTLE_ACCESS_RATE', 0.05))
+    THROTTLE_ACCESS_BURST = int(os.environ.get('THROTTLE_ACCESS_BURST', 5))
+    # simultaneous /request-access POSTs per process (scrypt hashing)
+    THROTTLE_MAX_CONCURRENT = int(os.environ.get('THROTTLE_MAX_CONCURRENT', 4))
+    # entries kept by the versioned dashboard cache (0 disables it) and where
+    # the data version lives; redis://... shares it between workers
+    DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', 64))
+    DATA_VERSION_URL = os.environ.get('DATA_VERSION_URL', 'memory://')
+    # most recent events shown by the dashboard charts before "load older"
+    DASHBOARD_EVENTS = int(os.environ.get('DASHBOARD_EVENTS', 5))
+    # arrival reports count a check-in as late this many minutes after the
+    # meeting's first check-in
+    ARRIVAL_LATE_MINUTES = int(os.environ.get('ARRIVAL_LATE_MINUTES', 30))
+    # exports are built by EXPORT_WORKERS background threads (0 builds them
+    # in the request); a download waits EXPORT_WAIT seconds before handing
+    # over to a progress page.  Files are kept in EXPORT_DIR per data
+    # version, evicted after EXPORT_MAX_AGE seconds or beyond EXPORT_MAX_BYTES
+    EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+    EXPORT_WAIT = float(os.environ.get('EXPORT_WAIT', 2))
+    EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'f2f-exports'))
+    EXPORT_MAX_AGE = int(os.environ.get('EXPORT_MAX_AGE', 86400))
+    EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', 200 * 1024 * 1024))
+    # processes rendering the reports of an event's zip bundle (0 renders
+    # them in the export thread)
+    BUNDLE_PROCESSES = int(os.environ.get('BUNDLE_PROCESSES', os.cpu_count() or 1))
+    # serve scan/register/api attendance from async views on an async
+    # driver (aiosqlite / aiomysql) instead of the sync ones
+    ASYNC_CHECKIN = os.environ.get('ASYNC_CHECKIN', '0') == '1'
@@ -0,0 +1,38 @@
+"""unique attendance per (meeting, user)
+
+Revision ID: mb36uniqatt
+Revises: mb35addleader
+Create Date: 2026-10-18 10:00:00.000000
+Note: duplicated rows created by concurrent check-ins are removed (the
+oldest confirmation is kept) before the unique index is created, so the
+application can rely on INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE."""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'mb36uniqatt'
+down_revision = 'mb35addleader'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'uq_attendance_meeting_user' in [i['name'] for i in insp.get_indexes('attendance')]:
+        return
+    # the derived table is required by MySQL, which refuses to select from
+    # the table being deleted from
+    op.execute(sa.text(
+        'DELETE FROM attendance WHERE id NOT IN ('
+        'SELECT id FROM (SELECT MIN(id) AS id FROM attendance '
+        'GROUP BY meeting_id, user_id) AS keep_rows)'))
+    op.create_index('uq_attendance_meeting_user', 'attendance',
+                    ['meeting_id', 'user_id'], unique=True)
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'uq_attendance_meeting_user' in [i['name'] for i in insp.get_indexes('attendance')]:
+        op.drop_index('uq_attendance_meeting_user', table_name='attendance')
@@ -0,0 +1,50 @@
+"""add indexed user.telefone_digits
+
+Revision ID: mb37teldigits
+Revises: mb36uniqatt
+Create Date: 2026-10-18 11:00:00.000000
+Note: the column holds the phone reduced to digits so logins and check-ins
+can find a user with one indexed lookup whatever mask the stored value
+has.  Existing rows are backfilled in batches to keep transactions short
+on large user tables."""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'mb37teldigits'
+down_revision = 'mb36uniqatt'
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'telefone_digits' not in [c['name'] for c in insp.get_columns('user')]:
+        op.add_column('user', sa.Column('telefone_digits', sa.String(20), nullable=True))
+        op.create_index('ix_user_telefone_digits', 'user', ['telefone_digits'])
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('telefone', sa.String),
+                    sa.column('telefone_digits', sa.String))
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.select(user.c.id, user.c.telefone)
+                            .where(user.c.id > last_id)
+                            .order_by(user.c.id).limit(BATCH)).fetchall()
+        if not rows:
+            break
+        conn.execute(user.update().where(user.c.id == sa.bindparam('uid'))
+                     .values(telefone_digits=sa.bindparam('digits')),
+                     [{'uid': r[0], 'digits': ''.join(ch for ch in (r[1] or '') if ch.isdigit())}
+                      for r in rows])
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'telefone_digits' in [c['name'] for c in insp.get_columns('user')]:
+        op.drop_index('ix_user_telefone_digits', table_name='user')
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.drop_column('telefone_digits')
@@ -0,0 +1,42 @@
+"""add meeting_stats rollup
+
+Revision ID: mb38meetingstats
+Revises: mb37teldigits
+Create Date: 2026-10-18 12:00:00.000000
+Note: attendance counts per meeting and user colour, maintained by
+app.stats on every attendance write so the dashboard no longer counts
+the attendance table.  The table is filled from existing rows here;
+`flask stats rebuild` recomputes it at any time."""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'mb38meetingstats'
+down_revision = 'mb37teldigits'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'meeting_stats' in insp.get_table_names():
+        return
+    op.create_table('meeting_stats',
+        sa.Column('meeting_id', sa.Integer(), sa.ForeignKey('meeting.id'), nullable=False),
+        sa.Column('cor', sa.String(50), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('first_attendance_id', sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint('meeting_id', 'cor'),
+    )
+    op.execute('INSERT INTO meeting_stats (meeting_id, cor, total, first_attendance_id) '
+               'SELECT a.meeting_id, u.cor, COUNT(a.id), MIN(a.id) '
+               'FROM attendance a JOIN user u ON u.id = a.user_id '
+               'GROUP BY a.meeting_id, u.cor')
+
+
+def downgrade():
+    conn = op.get_bind()
+    insp = sa.inspect(conn)
+    if 'meeting_stats' in insp.get_table_names():
+        op.drop_table('meeting_stats')
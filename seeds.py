@@ -6,6 +6,22 @@ from datetime import datetime
 import secrets
 
 
+def backfill_telefone_digits(conn, batch=1000):
+    """Fill user.telefone_digits for rows written before the column existed."""
+    from sqlalchemy import text
+    from app.models import phone_digits
+    last_id = 0
+    while True:
+        rows = conn.execute(text('SELECT id, telefone FROM user WHERE id > :last '
+                                 'ORDER BY id LIMIT :n'), {'last': last_id, 'n': batch}).fetchall()
+        if not rows:
+            break
+        conn.execute(text('UPDATE user SET telefone_digits = :d WHERE id = :id'),
+                     [{'id': r[0], 'd': phone_digits(r[1])} for r in rows])
+        conn.commit()
+        last_id = rows[-1][0]
+
+
 def create_original_admin():
     app = create_app()
     with app.app_context():
@@ -40,16 +56,36 @@ def create_original_admin():
                 cols5 = [row[1] for row in res5]
                 if 'region_id' not in cols5:
                     conn.execute(text('ALTER TABLE user ADD COLUMN region_id INTEGER'))
+                if 'telefone_digits' not in cols5:
+                    conn.execute(text('ALTER TABLE user ADD COLUMN telefone_digits VARCHAR(20)'))
+                    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_telefone_digits ON user (telefone_digits)'))
+                    conn.commit()
+                    backfill_telefone_digits(conn)
+                # one attendance per (meeting, user); drop duplicates first
+                conn.execute(text('DELETE FROM attendance WHERE id NOT IN '
+                                  '(SELECT MIN(id) FROM attendance GROUP BY meeting_id, user_id)'))
+                conn.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_meeting_user '
+                                  'ON attendance (meeting_id, user_id)'))
+                conn.commit()
+        # meeting_stats was just created by create_all on databases that had
+        # attendances before the rollup existed
+        from app import stats
+        from app.models import MeetingStat, Attendance
+        if MeetingStat.query.first() is None and Attendance.query.first() is not None:
+            stats.recount()
+            db.session.commit()
         # default administrator credentials (same as in app/__init__)
         telefone = ''.join(ch for ch in os.environ.get('DEFAULT_ADMIN_PHONE', '14981364342') if ch.isdigit())
         senha = os.environ.get('DEFAULT_ADMIN_PASSWORD', 'jr34139251')
-        user = User.query.filter_by(telefone=telefone).first()
+        user = User.by_phone(telefone)
         if user is None:
             user = User(telefone=telefone, nome='Arnaldo Martins Hidalgo Junior', cor='azul celeste')
         else:
             # ensure name and color are updated
             user.nome = 'Arnaldo Martins Hidalgo Junior'
-            user.cor = 'azul celeste'
+            if user.cor != 'azul celeste':
+                user.cor = 'azul celeste'
+                stats.recount(stats.attended(user.id))
         db.session.add(user)
         db.session.commit()
         if not user.admin_record: